@@ -0,0 +1,122 @@
+import glob
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from dewarp import FisheyeDewarper
+from stream import D, K
+
+def load_frames(path, limit):
+        """Load recorded frames from a directory of images or a video file"""
+        frames = []
+        if os.path.isdir(path):
+                for name in sorted(glob.glob(os.path.join(path, "*")))[:limit]:
+                        frame = cv2.imread(name)
+                        if frame is not None:
+                                frames.append(frame)
+        else:
+                cap = cv2.VideoCapture(path)
+                while len(frames) < limit:
+                        ret, frame = cap.read()
+                        if not ret:
+                                break
+                        frames.append(frame)
+                cap.release()
+        return frames
+
+def synthetic_frames(w, h, count):
+        """Noise frames for when no recording is at hand"""
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(count)]
+
+def record_frames(cam_index, path, count):
+        """Save frames from a camera so the benchmark can be rerun without it"""
+        os.makedirs(path, exist_ok=True)
+        cap = cv2.VideoCapture(cam_index)
+        for i in range(count):
+                ret, frame = cap.read()
+                if not ret:
+                        break
+                cv2.imwrite(os.path.join(path, f"frame_{i:05d}.png"), frame)
+        cap.release()
+
+def current_path(w, h):
+        """The original stream_camera path: remap, cvtColor to RGB, tobytes()"""
+        new_K = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(K, D, (w, h), np.eye(3), balance=0.05)
+        map1, map2 = cv2.fisheye.initUndistortRectifyMap(K, D, np.eye(3), new_K, (w, h), cv2.CV_16SC2)
+
+        def step(frame):
+                dewarped = cv2.remap(frame, map1, map2, interpolation=cv2.INTER_LINEAR)
+                rgb = cv2.cvtColor(dewarped, cv2.COLOR_BGR2RGB)
+                rgb.tobytes()
+        return step
+
+def fused_path(w, h, scale):
+        """Precomputed undistort + downscale into a preallocated buffer"""
+        out_size = (int(w * scale) // 2 * 2, int(h * scale) // 2 * 2)
+        dewarper = FisheyeDewarper(K, D, (w, h), out_size)
+
+        def step(frame):
+                dewarper(frame)
+        return step
+
+def measure(step, frames, repeat):
+        """Per-frame CPU and wall time in milliseconds"""
+        cpu_times = []
+        wall_times = []
+        for _ in range(repeat):
+                for frame in frames:
+                        cpu_start = time.process_time()
+                        wall_start = time.perf_counter()
+                        step(frame)
+                        wall_times.append(time.perf_counter() - wall_start)
+                        cpu_times.append(time.process_time() - cpu_start)
+        cpu = np.array(cpu_times) * 1000
+        wall = np.array(wall_times) * 1000
+        return cpu.mean(), np.percentile(wall, 50), np.percentile(wall, 95)
+
+def main():
+        parser = ArgumentParser(description="Per-frame ROV-side CPU time for the current and fused dewarp paths")
+        parser.add_argument('--input', help="Directory of recorded frames or a video file")
+        parser.add_argument('--record', type=int, metavar='CAMERA',
+                            help="Record frames from this camera index into --input first")
+        parser.add_argument('--frames', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--scale', type=float, action='append',
+                            help="Output scale for the fused path (repeatable, default 1.0 and 0.5)")
+        args = parser.parse_args()
+
+        if args.record is not None:
+                if not args.input:
+                        print("--record needs --input to write into")
+                        return 1
+                record_frames(args.record, args.input, args.frames)
+
+        if args.input:
+                frames = load_frames(args.input, args.frames)
+                if not frames:
+                        print(f"No frames found in {args.input}")
+                        return 1
+        else:
+                frames = synthetic_frames(args.width, args.height, min(args.frames, 30))
+
+        h, w = frames[0].shape[:2]
+        print(f"{len(frames)} frames at {w}x{h}, {args.repeat} passes")
+
+        paths = [("current (remap + cvtColor + tobytes)", current_path(w, h))]
+        for scale in args.scale or [1.0, 0.5]:
+                paths.append((f"fused (scale {scale:g})", fused_path(w, h, scale)))
+
+        for name, step in paths:
+                cpu, p50, p95 = measure(step, frames, args.repeat)
+                print(f"{name:40s} cpu {cpu:6.2f} ms/frame   wall p50 {p50:6.2f} ms   p95 {p95:6.2f} ms")
+        return 0
+
+if __name__ == "__main__":
+        sys.exit(main())
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from stage_timer import timer
+
+class LatestFrameSlot:
+        """Size-1 hand-off between capture and encode where the newest frame wins
+
+        put() never blocks: a frame the encoder has not picked up yet is
+        replaced and counted as dropped, so latency stays bounded when the
+        encoder falls behind instead of V4L2 buffers filling up.
+        """
+        def __init__(self):
+                self.cond = threading.Condition()
+                self.item = None
+                self.closed = False
+
+        def put(self, frame, captured_at):
+                """Store a frame, returning True if an unconsumed frame was dropped"""
+                with self.cond:
+                        dropped = self.item is not None
+                        self.item = (frame, captured_at)
+                        self.cond.notify()
+                        return dropped
+
+        def take(self, timeout=None):
+                """Wait for the newest (frame, captured_at), or None on timeout/close"""
+                with self.cond:
+                        if self.item is None and not self.closed:
+                                self.cond.wait(timeout)
+                        item = self.item
+                        self.item = None
+                        return item
+
+        def close(self):
+                with self.cond:
+                        self.closed = True
+                        self.cond.notify_all()
+
+class CameraStats:
+        """Per-camera counters for captured, dropped and encoded frames and their age"""
+        def __init__(self, name, report_interval=5.0):
+                self.name = name
+                self.report_interval = report_interval
+                self.lock = threading.Lock()
+                self.captured = 0
+                self.dropped = 0
+                self.encoded = 0
+                self.age_sum = 0.0
+                self.age_max = 0.0
+                self.age_count = 0
+                self.last_report = time.monotonic()
+
+        def on_captured(self, dropped):
+                with self.lock:
+                        self.captured += 1
+                        if dropped:
+                                self.dropped += 1
+
+        def on_encoded(self, captured_at):
+                """Count an encoded frame and its capture-to-encoded age"""
+                age = time.monotonic() - captured_at
+                with self.lock:
+                        self.encoded += 1
+                        self.age_sum += age
+                        self.age_count += 1
+                        self.age_max = max(self.age_max, age)
+
+        def snapshot(self):
+                with self.lock:
+                        return {
+                                "captured": self.captured,
+                                "dropped": self.dropped,
+                                "encoded": self.encoded,
+                                "age_ms": 1000 * self.age_sum / self.age_count if self.age_count else 0.0,
+                                "age_max_ms": 1000 * self.age_max,
+                        }
+
+        def maybe_report(self):
+                """Print the counters every report_interval seconds; ages are per interval"""
+                now = time.monotonic()
+                if now - self.last_report < self.report_interval:
+                        return
+                self.last_report = now
+                stats = self.snapshot()
+                print(f"{self.name}: captured {stats['captured']}, dropped {stats['dropped']}, "
+                      f"encoded {stats['encoded']}, age {stats['age_ms']:.0f} ms (max {stats['age_max_ms']:.0f} ms)")
+                with self.lock:
+                        self.age_sum = 0.0
+                        self.age_max = 0.0
+                        self.age_count = 0
+
+def capture_loop(cap, slot, stats):
+        """Capture stage: read frames as fast as the camera delivers them into the slot"""
+        stage = f"{stats.name} cap_read"
+        while not slot.closed:
+                started = timer.start()
+                ret, frame = cap.read()
+                if not ret:
+                        break
+                timer.stop(stage, started)
+                stats.on_captured(slot.put(frame, time.monotonic()))
+        slot.close()
@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+
+class FisheyeDewarper:
+        """Fisheye undistortion and optional downscale fused into one precomputed remap into a reused buffer"""
+        def __init__(self, K, D, in_size, out_size=None, balance=0.05):
+                w, h = in_size
+                out_w, out_h = out_size or in_size
+                self.in_size = (w, h)
+                self.out_size = (out_w, out_h)
+
+                new_K = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(K, D, (w, h), np.eye(3), balance=balance)
+
+                # Fold the output resolution into the rectified camera matrix
+                scale = np.diag([out_w / w, out_h / h, 1.0])
+                new_K = scale @ new_K
+
+                # Fixed-point maps are the fastest form for cv2.remap
+                self.map1, self.map2 = cv2.fisheye.initUndistortRectifyMap(
+                        K, D, np.eye(3), new_K, (out_w, out_h), cv2.CV_16SC2)
+                # Left as BGR: the encoder's caps say so, so no cvtColor is needed
+                self.out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+
+        def __call__(self, frame, dst=None):
+                """Dewarp frame into dst (or the internal buffer) and return it"""
+                if dst is None:
+                        dst = self.out
+                cv2.remap(frame, self.map1, self.map2, interpolation=cv2.INTER_LINEAR, dst=dst)
+                return dst
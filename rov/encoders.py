@@ -0,0 +1,154 @@
+import subprocess
+
+import numpy as np
+
+# PyGObject is optional on the ROV; without it we fall back to gst-launch
+try:
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+        Gst.init(None)
+except (ImportError, ValueError):
+        Gst = None
+
+def x264_settings(bitrate=4000, preset="ultrafast", key_int_max=30):
+        """x264enc properties shared by both encoder paths
+
+        With intra-refresh, x264 sends one IDR and then a recovery point SEI
+        (with SPS/PPS) every key_int_max frames; the topside history trims
+        its window at those.
+        """
+        return (f"tune=zerolatency speed-preset={preset} bitrate={bitrate} "
+                f"key-int-max={key_int_max} intra-refresh=true")
+
+def have_appsrc():
+        """Whether the in-process appsrc encoder can be used"""
+        return Gst is not None
+
+# GStreamer command template
+def make_gst_process(w, h, port, host_ip, fps=30, **x264):
+        return subprocess.Popen([
+        "gst-launch-1.0", "fdsrc", "!",
+        f"rawvideoparse", f"width={w}", f"height={h}", "format=bgr", f"framerate={fps}/1", "!",
+        "videoconvert", "!",
+        "x264enc", *x264_settings(**x264).split(), "!",
+        "rtph264pay", "config-interval=1", "pt=96", "!",
+        "udpsink", f"host={host_ip}", f"port={port}"
+        ], stdin=subprocess.PIPE)
+
+class SubprocessEncoder:
+        """Fallback encoder: raw BGR frames through a gst-launch stdin pipe"""
+        supports_reconfigure = False
+
+        def __init__(self, w, h, port, host_ip, fps=30, **x264):
+                self.proc = make_gst_process(w, h, port, host_ip, fps, **x264)
+                self.frame = np.empty((h, w, 3), dtype=np.uint8)
+
+        def push(self, fill):
+                """Let fill(dst) write a BGR frame into dst, then send it"""
+                fill(self.frame)
+                # The array is written through the buffer protocol, no tobytes() copy
+                self.proc.stdin.write(self.frame.data)
+
+        def set_bitrate(self, bitrate):
+                """gst-launch can't be reconfigured; only the framerate can adapt"""
+                return False
+
+        def set_size(self, w, h):
+                return False
+
+        def close(self):
+                self.proc.stdin.close()
+                self.proc.wait()
+
+class AppsrcEncoder:
+        """In-process encoder: frames are written straight into GStreamer buffers fed to appsrc"""
+        supports_reconfigure = True
+
+        def __init__(self, w, h, port, host_ip, fps=30, **x264):
+                self.shape = (h, w, 3)
+                self.size = h * w * 3
+                self.fps = fps
+                pipeline_str = (
+                        f'appsrc name=src is-live=true format=time do-timestamp=true block=false '
+                        f'caps={self._caps_string(w, h)} ! '
+                        f'videoconvert ! x264enc name=enc {x264_settings(**x264)} ! '
+                        'rtph264pay config-interval=1 pt=96 ! '
+                        f'udpsink host={host_ip} port={port}'
+                )
+                self.pipeline = Gst.parse_launch(pipeline_str)
+                self.appsrc = self.pipeline.get_by_name("src")
+                self.x264enc = self.pipeline.get_by_name("enc")
+                self.pipeline.set_state(Gst.State.PLAYING)
+                # Plain PyGObject maps buffers as read-only bytes copies; only the
+                # gst-python overrides hand out memory we can write in place
+                self.map_writable = self._map_writable()
+                self.frame = None if self.map_writable else np.empty(self.shape, dtype=np.uint8)
+
+        @staticmethod
+        def _map_writable():
+                """Whether a mapped Gst.Buffer can be written through a NumPy array"""
+                buf = Gst.Buffer.new_allocate(None, 1, None)
+                success, map_info = buf.map(Gst.MapFlags.WRITE)
+                if not success:
+                        return False
+                try:
+                        return np.ndarray((1,), dtype=np.uint8, buffer=map_info.data).flags.writeable
+                except TypeError:
+                        return False
+                finally:
+                        buf.unmap(map_info)
+
+        def _caps_string(self, w, h):
+                return f"video/x-raw,format=BGR,width={w},height={h},framerate={self.fps}/1"
+
+        def set_bitrate(self, bitrate):
+                """Change the x264 bitrate (kbps) while playing"""
+                self.x264enc.set_property("bitrate", int(bitrate))
+                return True
+
+        def set_size(self, w, h):
+                """Change the frame size while playing; x264enc renegotiates on the new caps"""
+                self.shape = (h, w, 3)
+                self.size = h * w * 3
+                if self.frame is not None:
+                        self.frame = np.empty(self.shape, dtype=np.uint8)
+                self.appsrc.set_property("caps", Gst.Caps.from_string(self._caps_string(w, h)))
+                return True
+
+        def _new_buffer(self, fill):
+                """Have fill() write a frame into a new buffer's memory, or into the reused frame without the overrides"""
+                if not self.map_writable:
+                        fill(self.frame)
+                        return Gst.Buffer.new_wrapped(self.frame.tobytes())
+
+                buf = Gst.Buffer.new_allocate(None, self.size, None)
+                success, map_info = buf.map(Gst.MapFlags.WRITE)
+                if not success:
+                        raise BrokenPipeError("Could not map a GStreamer buffer for writing")
+                try:
+                        fill(np.ndarray(self.shape, dtype=np.uint8, buffer=map_info.data))
+                finally:
+                        buf.unmap(map_info)
+                return buf
+
+        def push(self, fill):
+                """Let fill(dst) write a BGR frame into dst, then push it into the pipeline"""
+                ret = self.appsrc.emit("push-buffer", self._new_buffer(fill))
+                if ret != Gst.FlowReturn.OK:
+                        raise BrokenPipeError(f"appsrc push returned {ret}")
+
+        def close(self):
+                self.appsrc.emit("end-of-stream")
+                bus = self.pipeline.get_bus()
+                bus.timed_pop_filtered(2 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+                self.pipeline.set_state(Gst.State.NULL)
+
+def make_encoder(w, h, port, host_ip, use_subprocess=False, fps=30, **x264):
+        """In-process appsrc encoder when PyGObject is available, gst-launch otherwise
+
+        Extra keyword arguments (bitrate, preset, key_int_max) go to x264enc.
+        """
+        if use_subprocess or not have_appsrc():
+                return SubprocessEncoder(w, h, port, host_ip, fps, **x264)
+        return AppsrcEncoder(w, h, port, host_ip, fps, **x264)
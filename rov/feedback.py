@@ -0,0 +1,101 @@
+import json
+import socket
+import threading
+
+# Receive reports for a stream arrive on its video port plus this offset
+FEEDBACK_PORT_OFFSET = 100
+
+class FeedbackReceiver:
+        """Listens for the topside's JSON receive reports for one camera"""
+        def __init__(self, port, on_report):
+                self.port = port
+                self.on_report = on_report
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.sock.bind(("", port))
+                self.sock.settimeout(1.0)
+                self.running = True
+                self.thread = threading.Thread(target=self._run, name=f"feedback-{port}", daemon=True)
+                self.thread.start()
+
+        def _run(self):
+                while self.running:
+                        try:
+                                data, _ = self.sock.recvfrom(4096)
+                        except socket.timeout:
+                                continue
+                        except OSError:
+                                break
+                        try:
+                                report = json.loads(data)
+                        except ValueError:
+                                continue
+                        self.on_report(report)
+
+        def close(self):
+                self.running = False
+                self.sock.close()
+                self.thread.join(timeout=2.0)
+
+class AdaptiveController:
+        """AIMD bitrate control that steps down resolution, then framerate, once the bitrate is at its minimum"""
+        def __init__(self, max_bitrate, min_bitrate=500, scales=(1.0, 0.75, 0.5), fps=30, min_fps=10,
+                     loss_threshold=2.0, delay_threshold=100.0, decrease=0.7, increase=250, clean_reports=3):
+                self.lock = threading.Lock()
+                self.max_bitrate = max_bitrate
+                self.min_bitrate = min(min_bitrate, max_bitrate)
+                self.scales = tuple(scales)
+                self.max_fps = fps
+                self.min_fps = min(min_fps, fps)
+                # Loss above loss_threshold (%) or queueing delay above delay_threshold (ms) cuts the bitrate by decrease
+                self.loss_threshold = loss_threshold
+                self.delay_threshold = delay_threshold
+                self.decrease = decrease
+                self.increase = increase
+                # After clean_reports clean reports in a row one step is undone, the bitrate coming back by increase
+                self.clean_reports = clean_reports
+
+                self.bitrate = max_bitrate
+                self.scale_index = 0
+                self.fps = fps
+                self.clean = 0
+                self.changed = False
+
+        @property
+        def scale(self):
+                return self.scales[self.scale_index]
+
+        def on_report(self, report):
+                """Adjust the targets from one receive report"""
+                loss = report.get("loss", 0.0)
+                delay = report.get("delay_ms", 0.0)
+                with self.lock:
+                        before = (self.bitrate, self.scale_index, self.fps)
+                        if loss > self.loss_threshold or delay > self.delay_threshold:
+                                self.clean = 0
+                                if self.bitrate > self.min_bitrate:
+                                        self.bitrate = max(self.min_bitrate, int(self.bitrate * self.decrease))
+                                elif self.scale_index < len(self.scales) - 1:
+                                        self.scale_index += 1
+                                elif self.fps > self.min_fps:
+                                        self.fps = max(self.min_fps, self.fps // 2)
+                        else:
+                                self.clean += 1
+                                if self.clean >= self.clean_reports:
+                                        self.clean = 0
+                                        if self.fps < self.max_fps:
+                                                self.fps = min(self.max_fps, self.fps * 2)
+                                        elif self.scale_index > 0:
+                                                self.scale_index -= 1
+                                        elif self.bitrate < self.max_bitrate:
+                                                self.bitrate = min(self.max_bitrate, self.bitrate + self.increase)
+                        if (self.bitrate, self.scale_index, self.fps) != before:
+                                self.changed = True
+
+        def poll(self):
+                """Get (bitrate, scale, fps) if the targets changed since the last poll, else None"""
+                with self.lock:
+                        if not self.changed:
+                                return None
+                        self.changed = False
+                        return self.bitrate, self.scale, self.fps
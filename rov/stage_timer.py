@@ -0,0 +1,139 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+
+# Bucket edges (ms) for the histograms in dumps
+HISTOGRAM_EDGES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+class StageTimer:
+        """Rolling per-stage timings for the hot paths: t = timer.start() ... timer.stop("stage", t)"""
+        def __init__(self, enabled=False, window=512):
+                # Disabled, start() returns None and stop() returns at once, so the calls stay in per-frame code
+                self.enabled = enabled
+                # Last window durations per stage, for percentiles and histograms
+                self.window = window
+                self.lock = threading.Lock()
+                self.samples = {}
+                self.counts = {}
+
+        def start(self):
+                return time.perf_counter() if self.enabled else None
+
+        def stop(self, name, started):
+                if started is None:
+                        return
+                self.record(name, time.perf_counter() - started)
+
+        def record(self, name, seconds):
+                """Add one duration for a stage"""
+                with self.lock:
+                        samples = self.samples.get(name)
+                        if samples is None:
+                                samples = self.samples[name] = deque(maxlen=self.window)
+                                self.counts[name] = 0
+                        samples.append(seconds)
+                        self.counts[name] += 1
+
+        def reset(self):
+                with self.lock:
+                        self.samples.clear()
+                        self.counts.clear()
+
+        def snapshot(self):
+                """{stage: count, mean/p50/p90/p99/max in ms, and histogram bucket counts} over the window"""
+                with self.lock:
+                        windows = {name: sorted(samples) for name, samples in self.samples.items()}
+                        counts = dict(self.counts)
+
+                result = {}
+                for name, samples in sorted(windows.items()):
+                        if not samples:
+                                continue
+                        ms = [s * 1000 for s in samples]
+                        pick = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))]
+                        histogram = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+                        edge = 0
+                        for value in ms:
+                                while edge < len(HISTOGRAM_EDGES_MS) and value > HISTOGRAM_EDGES_MS[edge]:
+                                        edge += 1
+                                histogram[edge] += 1
+                        result[name] = {
+                                "count": counts[name],
+                                "mean_ms": sum(ms) / len(ms),
+                                "p50_ms": pick(0.5),
+                                "p90_ms": pick(0.9),
+                                "p99_ms": pick(0.99),
+                                "max_ms": ms[-1],
+                                "histogram": histogram,
+                        }
+                return result
+
+        def overlay_text(self):
+                """Fixed-width table for the on-screen overlay"""
+                lines = [f"{'stage':<24}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}"]
+                for name, stats in self.snapshot().items():
+                        lines.append(f"{name:<24}{stats['p50_ms']:8.2f}{stats['p90_ms']:8.2f}"
+                                     f"{stats['p99_ms']:8.2f}{stats['max_ms']:8.2f}")
+                return "\n".join(lines)
+
+        def dump(self, path):
+                """Write the current snapshot; .csv appends one row per stage, anything else rewrites JSON"""
+                snapshot = self.snapshot()
+                now = time.strftime("%Y-%m-%dT%H:%M:%S")
+                if str(path).endswith(".csv"):
+                        new_file = not os.path.exists(path)
+                        with open(path, "a", newline="") as f:
+                                writer = csv.writer(f)
+                                if new_file:
+                                        writer.writerow(["time", "stage", "count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"])
+                                for name, stats in snapshot.items():
+                                        writer.writerow([now, name, stats["count"]] +
+                                                        [f"{stats[key]:.3f}" for key in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")])
+                else:
+                        tmp = f"{path}.tmp"
+                        with open(tmp, "w") as f:
+                                json.dump({"time": now, "histogram_edges_ms": HISTOGRAM_EDGES_MS, "stages": snapshot}, f, indent=2)
+                        os.replace(tmp, path)
+
+# One timer per process, shared by every instrumented module
+timer = StageTimer(enabled=bool(os.environ.get("STAGE_TIMING")))
+
+class ProfileToggle:
+        """cProfile of the calling thread, switched on and off (e.g. from SIGUSR1)
+
+        On stop the profile is saved as a .prof file for snakeviz/pstats and the
+        top functions are printed. For whole-process sampling without this, run
+        py-spy against the PID; each camera streams from its own process.
+        """
+        def __init__(self, directory=".", prefix="profile"):
+                self.directory = directory
+                self.prefix = prefix
+                self.profile = None
+
+        @property
+        def active(self):
+                return self.profile is not None
+
+        def toggle(self):
+                """Start or stop profiling; returns the saved path when stopping"""
+                if self.profile is None:
+                        self.profile = cProfile.Profile()
+                        self.profile.enable()
+                        print(f"Profiling started (pid {os.getpid()})")
+                        return None
+
+                self.profile.disable()
+                path = os.path.join(self.directory, f"{self.prefix}_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+                self.profile.dump_stats(path)
+                out = io.StringIO()
+                pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(15)
+                print(out.getvalue())
+                print(f"Profile saved to {path}")
+                self.profile = None
+                return path
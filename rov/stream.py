@@ -1,39 +1,123 @@
 import cv2
 import numpy as np
-import subprocess
+import json
+import multiprocessing
+import os
+import signal
 import threading
+import time
 from argparse import ArgumentParser
 
-parser = ArgumentParser()
-parser.add_argument('host_ip')
-args = parser.parse_args()
-host_ip = args.host_ip
+from capture import CameraStats, LatestFrameSlot, capture_loop
+from dewarp import FisheyeDewarper
+from encoders import make_encoder
+from feedback import FEEDBACK_PORT_OFFSET, AdaptiveController, FeedbackReceiver
+from stage_timer import ProfileToggle, timer
 
-# Shared camera matrix and distortion
+# Shared camera matrix and distortion, used when a camera has no calibration of its own
 K = np.array([[522, 0.0, 320.0],
                 [0.0, 522, 240.0],
                 [0.0, 0.0, 1.0]], dtype=np.float32)
 
 D = np.array([-0.2, 0.02, 0.0, 0.0], dtype=np.float32)
 
-# GStreamer command template
-def make_gst_process(w, h, port):
-        return subprocess.Popen([
-        "gst-launch-1.0", "fdsrc", "!",
-        f"rawvideoparse", f"width={w}", f"height={h}", "format=rgb", "framerate=30/1", "!",
-        "videoconvert", "!",
-        "x264enc", "tune=zerolatency", "speed-preset=ultrafast", "bitrate=4000", "key-int-max=30", "intra-refresh=true", "!",
-        "rtph264pay", "config-interval=1", "pt=96", "!",
-        "udpsink", f"host={host_ip}", f"port={port}"
-        ], stdin=subprocess.PIPE)
-
-# Camera thread function
-def stream_camera(cam_index, port, name):
+# Per-camera settings and their defaults; width/height/framerate are requested from the camera
+CAMERA_DEFAULTS = {
+        "name": None,
+        "device": 0,
+        "port": 5000,
+        "width": None,
+        "height": None,
+        "framerate": 30,
+        "bitrate": 4000,
+        "preset": "ultrafast",
+        "key_int_max": 30,
+        "scale": 1.0,
+        "balance": 0.05,
+        "K": K.tolist(),
+        "D": D.tolist(),
+        "cpus": None,
+        "adaptive": True,
+        "min_bitrate": 500,
+}
+
+# The two cameras the ROV has always streamed
+DEFAULT_CAMERAS = [
+        {"name": "Camera 0", "device": 0, "port": 5000},
+        {"name": "Camera 4", "device": 4, "port": 5001},
+]
+
+def load_config(path):
+        """Load the camera list from a JSON (or, with PyYAML installed, YAML) file"""
+        with open(path) as f:
+                if path.endswith((".yaml", ".yml")):
+                        import yaml
+                        config = yaml.safe_load(f)
+                else:
+                        config = json.load(f)
+
+        cameras = []
+        for i, camera in enumerate(config.get("cameras", [])):
+                unknown = set(camera) - set(CAMERA_DEFAULTS)
+                if unknown:
+                        raise ValueError(f"Camera {i} in {path} has unknown settings: {', '.join(sorted(unknown))}")
+                cameras.append(camera)
+        config["cameras"] = cameras
+        return config
+
+def camera_settings(camera):
+        """Fill in defaults for one camera entry"""
+        settings = dict(CAMERA_DEFAULTS)
+        settings.update(camera)
+        if settings["name"] is None:
+                settings["name"] = f"Camera {settings['device']}"
+        return settings
+
+def pin_to_cpus(cpus, name):
+        """Pin the current process to the given CPU cores (Linux only)"""
+        if cpus is None:
+                return
+        if isinstance(cpus, int):
+                cpus = [cpus]
+        if not hasattr(os, "sched_setaffinity"):
+                print(f"{name}: CPU pinning is not supported on this platform.")
+                return
+        os.sched_setaffinity(0, set(cpus))
+
+# Camera process function
+def stream_camera(camera, host_ip, use_subprocess=False, timing_dir=None, timing_interval=10.0):
+        settings = camera_settings(camera)
+        name = settings["name"]
+        cam_index = settings["device"]
+        port = settings["port"]
+        pin_to_cpus(settings["cpus"], name)
+
+        # Stage timings dumped to CSV, and cProfile of the encode loop on SIGUSR1
+        slug = name.replace(" ", "_")
+        timing_path = None
+        if timing_dir:
+                os.makedirs(timing_dir, exist_ok=True)
+                timing_path = os.path.join(timing_dir, f"{slug}_timing.csv")
+                timer.enabled = True
+        last_dump = time.monotonic()
+        if hasattr(signal, "SIGUSR1"):
+                profiler = ProfileToggle(timing_dir or ".", f"{slug}_profile")
+                signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle())
+        remap_stage = f"{name} remap"
+        push_stage = f"{name} push"
+
         cap = cv2.VideoCapture(cam_index)
         if not cap.isOpened():
                 print(f"Camera {cam_index} failed to open.")
                 return
 
+        # Keep the driver queue minimal so we never read stale frames
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if settings["width"] and settings["height"]:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings["width"])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings["height"])
+        cap.set(cv2.CAP_PROP_FPS, settings["framerate"])
+
         ret, frame = cap.read()
         if not ret:
                 print(f"Camera {cam_index} failed to grab frame.")
@@ -41,41 +125,141 @@ def stream_camera(cam_index, port, name):
                 return
 
         h, w = frame.shape[:2]
+        scale = settings["scale"]
+        out_w, out_h = int(w * scale) // 2 * 2, int(h * scale) // 2 * 2
 
-        # Compute remap maps
-        new_K = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(K, D, (w, h), np.eye(3), balance=0.05)
-        map1, map2 = cv2.fisheye.initUndistortRectifyMap(K, D, np.eye(3), new_K, (w, h), cv2.CV_16SC2)
+        # Compute the combined undistort + downscale maps once
+        cam_K = np.array(settings["K"], dtype=np.float32)
+        cam_D = np.array(settings["D"], dtype=np.float32)
+        dewarper = FisheyeDewarper(cam_K, cam_D, (w, h), (out_w, out_h), balance=settings["balance"])
 
         # Start GStreamer pipeline
-        proc = make_gst_process(w, h, port)
+        encoder = make_encoder(out_w, out_h, port, host_ip, use_subprocess=use_subprocess,
+                               fps=settings["framerate"], bitrate=settings["bitrate"],
+                               preset=settings["preset"], key_int_max=settings["key_int_max"])
+
+        # Dewarp straight into the encoder's buffer; the encoder converts from BGR
+        def dewarp(dst):
+                started = timer.start()
+                dewarper(frame, dst=dst)
+                timer.stop(remap_stage, started)
+
+        # Adapt bitrate, resolution and framerate to the topside's receive reports
+        controller = None
+        receiver = None
+        dewarpers = {scale: dewarper}
+        frame_interval = 0.0
+        last_sent = 0.0
+        if settings["adaptive"]:
+                if encoder.supports_reconfigure:
+                        controller = AdaptiveController(settings["bitrate"], settings["min_bitrate"],
+                                                        fps=settings["framerate"])
+                else:
+                        controller = AdaptiveController(settings["bitrate"], settings["bitrate"], scales=(1.0,),
+                                                        fps=settings["framerate"])
+                receiver = FeedbackReceiver(port + FEEDBACK_PORT_OFFSET, controller.on_report)
+
+        # Capture runs in its own thread and hands over only the newest frame
+        slot = LatestFrameSlot()
+        stats = CameraStats(name)
+        capture_thread = threading.Thread(target=capture_loop, args=(cap, slot, stats), daemon=True)
+        capture_thread.start()
 
         while True:
-                ret, frame = cap.read()
-                if not ret:
-                 break
+                item = slot.take(timeout=1.0)
+                if item is None:
+                        if slot.closed:
+                                break
+                        continue
+                frame, captured_at = item
+
+                if controller is not None:
+                        change = controller.poll()
+                        if change is not None:
+                                bitrate, level, fps = change
+                                print(f"{name}: adapting to {bitrate} kbps, scale {level:g}, {fps} fps")
+                                encoder.set_bitrate(bitrate)
+                                level_scale = scale * level
+                                if level_scale not in dewarpers:
+                                        size = (int(w * level_scale) // 2 * 2, int(h * level_scale) // 2 * 2)
+                                        dewarpers[level_scale] = FisheyeDewarper(cam_K, cam_D, (w, h), size,
+                                                                                 balance=settings["balance"])
+                                if dewarpers[level_scale] is not dewarper:
+                                        dewarper = dewarpers[level_scale]
+                                        encoder.set_size(*dewarper.out_size)
+                                frame_interval = 1.0 / fps if fps < settings["framerate"] else 0.0
 
-                # Dewarp and convert to RGB
-                dewarped = cv2.remap(frame, map1, map2, interpolation=cv2.INTER_LINEAR)
-                rgb = cv2.cvtColor(dewarped, cv2.COLOR_BGR2RGB)
+                        # Drop frames to meet a reduced framerate
+                        if captured_at - last_sent < frame_interval * 0.9:
+                                continue
+                        last_sent = captured_at
 
+                started = timer.start()
                 try:
-                        proc.stdin.write(rgb.tobytes())
+                        encoder.push(dewarp)
                 except BrokenPipeError:
                         print(f"GStreamer pipeline for camera {cam_index} closed.")
                         break
+                timer.stop(push_stage, started)
 
+                stats.on_encoded(captured_at)
+                stats.maybe_report()
+                if timing_path and captured_at - last_dump >= timing_interval:
+                        last_dump = captured_at
+                        try:
+                                timer.dump(timing_path)
+                        except OSError as e:
+                                print(f"{name}: failed to write stage timings: {e}")
 
+        if receiver is not None:
+                receiver.close()
+        slot.close()
+        capture_thread.join(timeout=1.0)
         cap.release()
-        proc.stdin.close()
-        proc.wait()
+        encoder.close()
+
+def main():
+        parser = ArgumentParser()
+        parser.add_argument('host_ip', nargs='?',
+                            help="Topside IP address (overrides host_ip in the config file)")
+        parser.add_argument('--config', help="JSON/YAML file listing the cameras to stream")
+        parser.add_argument('--subprocess', action='store_true',
+                            help="Pipe frames to gst-launch instead of the in-process appsrc encoder")
+        parser.add_argument('--scale', type=float,
+                            help="Output size relative to the camera resolution, for every camera")
+        parser.add_argument('--timing', metavar='DIR',
+                            help="Record per-stage timings and append them to DIR/<camera>_timing.csv")
+        parser.add_argument('--timing-interval', type=float, default=10.0,
+                            help="Seconds between stage timing dumps")
+        args = parser.parse_args()
+
+        config = load_config(args.config) if args.config else {"cameras": DEFAULT_CAMERAS}
+        host_ip = args.host_ip or config.get("host_ip")
+        if not host_ip:
+                parser.error("host_ip is required on the command line or in the config file")
 
-# Start both cameras in threads
-t0 = threading.Thread(target=stream_camera, args=(0, 5000, "Camera 0"))
-t1 = threading.Thread(target=stream_camera, args=(4, 5001, "Camera 4"))
+        cameras = config["cameras"]
+        if args.scale is not None:
+                cameras = [dict(camera, scale=args.scale) for camera in cameras]
 
-t0.start()
-t1.start()
+        # One process per camera so remap/encode never contend for the GIL
+        context = multiprocessing.get_context("spawn")
+        processes = []
+        for camera in cameras:
+                process = context.Process(target=stream_camera,
+                                          args=(camera, host_ip, args.subprocess, args.timing, args.timing_interval),
+                                          name=camera_settings(camera)["name"])
+                process.start()
+                processes.append(process)
 
-t0.join()
-t1.join()
+        try:
+                for process in processes:
+                        process.join()
+        except KeyboardInterrupt:
+                for process in processes:
+                        process.terminate()
+                for process in processes:
+                        process.join()
 
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import cv2
+
+from retinex import FastMultiScaleRetinex, underwater_retinex_gpu
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+
+# Per-process Retinex settings, set up by the pool initializer
+_worker = {}
+
+def init_worker(fast, backend, image_format, quality):
+    """Pool initializer: one Retinex engine per process, and no nested OpenCV threads"""
+    cv2.setNumThreads(1)
+    _worker["msr"] = FastMultiScaleRetinex() if fast else None
+    _worker["backend"] = backend
+    _worker["format"] = image_format
+    _worker["params"] = [cv2.IMWRITE_JPEG_QUALITY, quality] if image_format == "jpg" else []
+
+def write_atomic(path, frame):
+    """Write via a temporary file so an interrupted run never leaves a half-written output"""
+    tmp = path.with_name(f".{path.name}.tmp{path.suffix}")
+    if not cv2.imwrite(str(tmp), frame, _worker["params"]):
+        raise IOError(f"Could not write {path}")
+    os.replace(tmp, path)
+
+def process_frame(frame, out_path, decode_time=0.0):
+    """Retinex + encode one decoded frame, returning per-stage times"""
+    start = time.perf_counter()
+    result = underwater_retinex_gpu(frame, msr=_worker["msr"], backend=_worker["backend"])
+    retinex_done = time.perf_counter()
+    write_atomic(Path(out_path), result)
+    return decode_time, retinex_done - start, time.perf_counter() - retinex_done
+
+def process_image(in_path, out_path):
+    """Decode, Retinex and encode one image file"""
+    start = time.perf_counter()
+    frame = cv2.imread(str(in_path))
+    if frame is None:
+        raise IOError(f"Could not read {in_path}")
+    return process_frame(frame, out_path, time.perf_counter() - start)
+
+def image_jobs(input_dir, output_dir, image_format):
+    """(function, args) for each image that has no output yet"""
+    for path in sorted(Path(input_dir).iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        out_path = Path(output_dir) / f"{path.stem}_retinex.{image_format}"
+        if out_path.exists():
+            continue
+        yield process_image, (path, out_path)
+
+def video_jobs(video_path, output_dir, image_format, every):
+    """(function, args) for each selected video frame that has no output yet
+
+    Frames are decoded here, lazily, so only the in-flight ones are in memory.
+    Finished frames are skipped with grab(), which does not convert the frame.
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise IOError(f"Could not open {video_path}")
+    stem = Path(video_path).stem
+    index = 0
+    try:
+        while True:
+            out_path = Path(output_dir) / f"{stem}_{index:06d}_retinex.{image_format}"
+            wanted = index % every == 0 and not out_path.exists()
+            start = time.perf_counter()
+            if not wanted:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield process_frame, (frame, out_path, time.perf_counter() - start)
+            index += 1
+    finally:
+        cap.release()
+
+def run(jobs, workers, initargs):
+    """Run jobs on a process pool with a bounded number in flight, returning stage totals"""
+    totals = [0.0, 0.0, 0.0]
+    done = 0
+    failed = 0
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as pool:
+        pending = set()
+        for fn, args in jobs:
+            pending.add(pool.submit(fn, *args))
+            if len(pending) < max_in_flight:
+                continue
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done, failed = _collect(future, totals, done, failed)
+        for future in pending:
+            done, failed = _collect(future, totals, done, failed)
+    return totals, done, failed
+
+def _collect(future, totals, done, failed):
+    try:
+        times = future.result()
+    except Exception as e:
+        print(f"Error processing frame: {e}")
+        return done, failed + 1
+    for i, t in enumerate(times):
+        totals[i] += t
+    done += 1
+    if done % 100 == 0:
+        print(f"{done} frames done")
+    return done, failed
+
+def main():
+    parser = ArgumentParser(description="Retinex-correct a directory of images or a recorded video")
+    parser.add_argument('input', help="Directory of images or a video file")
+    parser.add_argument('output', help="Directory for the corrected frames")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--format', choices=["jpg", "png"], default="jpg")
+    parser.add_argument('--quality', type=int, default=95, help="JPEG quality")
+    parser.add_argument('--every', type=int, default=1, help="Only process every Nth video frame")
+    parser.add_argument('--fast', action='store_true', help="Use the FastMultiScaleRetinex engine")
+    parser.add_argument('--backend', help="Retinex backend (cpu, opencl, cuda, auto)")
+    args = parser.parse_args()
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    if Path(args.input).is_dir():
+        jobs = image_jobs(args.input, args.output, args.format)
+    else:
+        jobs = video_jobs(args.input, args.output, args.format, max(args.every, 1))
+
+    # Finished outputs are skipped above, so rerunning resumes where it stopped
+    start = time.perf_counter()
+    totals, done, failed = run(jobs, args.workers, (args.fast, args.backend, args.format, args.quality))
+    elapsed = time.perf_counter() - start
+
+    print(f"Processed {done} frames ({failed} failed) in {elapsed:.1f} s with {args.workers} workers: "
+          f"{done / elapsed if elapsed else 0.0:.2f} frames/s")
+    if done:
+        decode, retinex, encode = (1000 * t / done for t in totals)
+        print(f"Per frame: decode {decode:.1f} ms, retinex {retinex:.1f} ms, encode+write {encode:.1f} ms")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
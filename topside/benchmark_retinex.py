@@ -0,0 +1,131 @@
+import sys
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from denoise import DENOISERS, bilateral
+from retinex import (FastMultiScaleRetinex, StreamingRetinex, get_backend, multi_scale_retinex_gpu,
+                     underwater_retinex_gpu)
+
+def make_test_frame(width, height, seed=0):
+    """Synthetic underwater-looking frame: smooth blue/green cast plus noise"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.stack([
+        120 + 60 * np.sin(x / 50.0),
+        90 + 40 * np.cos(y / 70.0),
+        40 + 20 * np.sin((x + y) / 90.0),
+    ], axis=-1)
+    frame += rng.normal(0, 10, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def ssim(a, b):
+    """Mean structural similarity of two uint8 images (Gaussian window, Wang et al. 2004)"""
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda x: cv2.GaussianBlur(x, (11, 11), 1.5)
+    mean_a, mean_b = blur(a), blur(b)
+    var_a = blur(a * a) - mean_a * mean_a
+    var_b = blur(b * b) - mean_b * mean_b
+    cov = blur(a * b) - mean_a * mean_b
+    ssim_map = ((2 * mean_a * mean_b + c1) * (2 * cov + c2)) / ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def time_call(fn, frame, runs):
+    """Average milliseconds per call after one warm-up call"""
+    result = fn(frame)
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = fn(frame)
+    return (time.perf_counter() - start) * 1000 / runs, result
+
+def main():
+    parser = ArgumentParser(description="Benchmark and check the fast Multi-Scale Retinex engine")
+    parser.add_argument('--image', help="Image file to use instead of a synthetic frame")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--backend', help="Retinex backend for the reference path (cpu, opencl, cuda, auto)")
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help="Max absolute difference allowed in the log-domain MSR output")
+    args = parser.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+        if frame is None:
+            print(f"Could not read {args.image}")
+            return 1
+    else:
+        frame = make_test_frame(args.width, args.height)
+
+    h, w = frame.shape[:2]
+    img_float = frame.astype(np.float32)
+    engine = FastMultiScaleRetinex()
+
+    backend = get_backend(args.backend).name
+    print(f"Frame: {w}x{h}, {args.runs} runs, {backend} backend")
+    ref_ms, ref = time_call(lambda f: multi_scale_retinex_gpu(f, backend=backend), img_float, args.runs)
+    fast_ms, fast = time_call(engine, img_float, args.runs)
+    fast = fast.copy()  # the engine reuses its output buffer
+    print(f"MSR reference:        {ref_ms:8.1f} ms/frame")
+    print(f"MSR fast engine:      {fast_ms:8.1f} ms/frame ({ref_ms / fast_ms:.1f}x)")
+
+    ref_full_ms, ref_full = time_call(lambda f: underwater_retinex_gpu(f, backend=backend), frame, args.runs)
+    fast_full_ms, fast_full = time_call(lambda f: underwater_retinex_gpu(f, msr=engine, backend=backend), frame, args.runs)
+    print(f"Underwater reference: {ref_full_ms:8.1f} ms/frame")
+    print(f"Underwater fast:      {fast_full_ms:8.1f} ms/frame ({ref_full_ms / fast_full_ms:.1f}x)")
+
+    # Fused NumPy backend with box-filter Gaussians
+    numpy_ms, numpy_full = time_call(lambda f: underwater_retinex_gpu(f, backend="numpy"), frame, args.runs)
+    print(f"Underwater numpy:     {numpy_ms:8.1f} ms/frame ({ref_full_ms / numpy_ms:.1f}x)")
+    numpy_backend = get_backend("numpy")
+    numpy_backend.engine.load_uint8(frame, numpy_backend._wb_scale(frame))
+    numpy_msr = numpy_backend.engine.from_loaded().copy()
+    ref_wb_msr = multi_scale_retinex_gpu(get_backend(backend).white_balance(frame).astype(np.float32),
+                                         backend=backend)
+
+    # Streaming mode on a static scene only refreshes every refresh_interval frames; against the
+    # fast engine with the same denoise, and without it, since the denoise is not cached
+    streaming_runs = max(args.runs, 2 * StreamingRetinex().refresh_interval)
+    for denoise in (None, "off"):
+        streaming = StreamingRetinex(denoise=denoise)
+        stream_ms, _ = time_call(streaming, frame, streaming_runs)
+        fast_ms_same, _ = time_call(lambda f: underwater_retinex_gpu(f, msr=engine, backend=backend, denoise=denoise),
+                                    frame, args.runs)
+        label = "Underwater streaming:" if denoise is None else "Streaming no denoise:"
+        print(f"{label} {stream_ms:8.1f} ms/frame ({fast_ms_same / stream_ms:.1f}x fast "
+              f"at {fast_ms_same:.1f} ms, {streaming.refreshes} refreshes)")
+
+    # Denoise methods against the current bilateral output, on the same normalized frame
+    normalized = cv2.normalize(ref_wb_msr, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    reference = bilateral(normalized)
+    print("Denoise (PSNR/SSIM against the bilateral):")
+    for name, denoiser in DENOISERS.items():
+        ms, out = time_call(denoiser, normalized, args.runs)
+        psnr = "   same" if name == "bilateral" else f"{cv2.PSNR(reference, out):5.1f} dB"
+        print(f"  {name:<17} {ms:8.1f} ms/frame  PSNR {psnr}  SSIM {ssim(reference, out):.4f}")
+
+    # Equivalence check against the current implementation
+    diff = np.abs(fast - ref)
+    pixel_diff = np.abs(fast_full.astype(np.int16) - ref_full.astype(np.int16))
+    print(f"MSR max abs diff: {diff.max():.4f} (mean {diff.mean():.4f}, tolerance {args.tolerance})")
+    print(f"Output pixel diff: max {pixel_diff.max()}, mean {pixel_diff.mean():.2f}")
+    numpy_diff = np.abs(numpy_msr - ref_wb_msr)
+    numpy_pixel_diff = np.abs(numpy_full.astype(np.int16) - ref_full.astype(np.int16))
+    print(f"Numpy MSR max abs diff: {numpy_diff.max():.4f} (mean {numpy_diff.mean():.4f})")
+    print(f"Numpy output pixel diff: max {numpy_pixel_diff.max()}, mean {numpy_pixel_diff.mean():.2f}")
+
+    if diff.max() > args.tolerance:
+        print("FAIL: fast engine is outside tolerance")
+        return 1
+    if numpy_diff.max() > args.tolerance:
+        print("FAIL: numpy backend is outside tolerance")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
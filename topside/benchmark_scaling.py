@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from benchmark_retinex import make_test_frame, time_call
+from retinex import FastMultiScaleRetinex, TiledMultiScaleRetinex, get_backend, underwater_retinex_gpu
+
+def main():
+    parser = ArgumentParser(description="Thread scaling of the tiled Retinex against the untiled engine")
+    parser.add_argument('--image', help="Image file to use instead of a synthetic frame")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1,
+                        help="Time 1..N worker threads (default: one per core)")
+    parser.add_argument('--opencv-threads', type=int,
+                        help="cv2.setNumThreads() for the run; 1 keeps OpenCV's own threading out of the numbers")
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help="Max absolute difference allowed in the log-domain MSR output")
+    parser.add_argument('--json', help="Write the timings as JSON to this file")
+    args = parser.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+        if frame is None:
+            print(f"Could not read {args.image}")
+            return 1
+    else:
+        frame = make_test_frame(args.width, args.height)
+    if args.opencv_threads is not None:
+        cv2.setNumThreads(args.opencv_threads)
+
+    h, w = frame.shape[:2]
+    img_float = frame.astype(np.float32)
+    print(f"Frame: {w}x{h}, {args.runs} runs, {os.cpu_count()} cores, OpenCV threads {cv2.getNumThreads()}")
+
+    untiled = FastMultiScaleRetinex()
+    untiled_ms, reference = time_call(untiled, img_float, args.runs)
+    reference = reference.copy()  # the engine reuses its output buffer
+    reference_full = underwater_retinex_gpu(frame, msr=untiled, backend="cpu")
+    cpu = get_backend("cpu")
+    print(f"untiled          {untiled_ms:8.1f} ms/frame")
+
+    results = {"width": w, "height": h, "cpu_count": os.cpu_count(), "opencv_threads": cv2.getNumThreads(),
+               "untiled_ms": untiled_ms, "tiled": []}
+    failed = False
+    base_ms = None
+    for workers in range(1, args.max_workers + 1):
+        engine = TiledMultiScaleRetinex(workers=workers)
+        tiled_ms, out = time_call(engine, img_float, args.runs)
+        diff = float(np.abs(out - reference).max())
+
+        # Whole pipeline as the tiled backend runs it
+        full = cpu.normalize(engine(cpu.white_balance(frame).astype(np.float32)))
+        full_diff = int(np.abs(full.astype(np.int16) - reference_full).max())
+        engine.close()
+
+        if base_ms is None:
+            base_ms = tiled_ms
+        speedup = base_ms / tiled_ms
+        ok = diff <= args.tolerance and full_diff <= 1
+        failed |= not ok
+        print(f"{workers:2d} worker(s)     {tiled_ms:8.1f} ms/frame  {untiled_ms / tiled_ms:5.2f}x untiled  "
+              f"{speedup:5.2f}x one worker  efficiency {speedup / workers:4.0%}  "
+              f"MSR diff {diff:.2e}, pixel diff {full_diff}{'' if ok else '  FAIL'}")
+        results["tiled"].append({"workers": workers, "ms": tiled_ms, "speedup": speedup,
+                                 "msr_diff": diff, "pixel_diff": full_diff})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.json}")
+
+    if failed:
+        print(f"FAIL: tiled output differs from the untiled engine by more than {args.tolerance}")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
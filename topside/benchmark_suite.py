@@ -0,0 +1,279 @@
+import contextlib
+import functools
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from benchmark_retinex import make_test_frame
+from denoise import DENOISERS
+from retinex import (FastMultiScaleRetinex, StreamingRetinex, get_backend, multi_scale_retinex_gpu,
+                     single_scale_retinex_gpu, underwater_retinex_gpu, white_balance)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# The ROV's fisheye remap lives in rov/dewarp.py, which is missing when only topside/ was copied
+ROV_DEWARP = Path(__file__).parent.parent / "rov" / "dewarp.py"
+
+@functools.lru_cache(maxsize=None)
+def load_rov_dewarp():
+    """Load rov/dewarp.py once, or None if it is not there"""
+    if not ROV_DEWARP.exists():
+        return None
+    spec = importlib.util.spec_from_file_location("rov_dewarp", ROV_DEWARP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+RESOLUTIONS = {
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+# Same lens model as the ROV's defaults in rov/stream.py, scaled to the frame size
+FOCAL_PER_WIDTH = 522 / 640
+DISTORTION = np.array([-0.2, 0.02, 0.0, 0.0], dtype=np.float32)
+
+def rss_mb():
+    """Current resident set size in MB (falls back to the peak where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+def summarize(samples, wall=None):
+    """Latency percentiles (ms) and throughput for a list of per-call times in seconds"""
+    ms = np.array(samples) * 1000
+    total = wall if wall is not None else ms.sum() / 1000
+    return {
+        "runs": len(samples),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "fps": len(samples) / total if total > 0 else 0.0,
+    }
+
+def run_stage(fn, inputs, runs, warmup, max_seconds):
+    """Time fn over the inputs in turn; stops early once max_seconds is used up (at least 3 runs)"""
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    rss_before = rss_mb()
+    samples = []
+    start = time.perf_counter()
+    for i in range(runs):
+        t = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        samples.append(time.perf_counter() - t)
+        if len(samples) >= 3 and time.perf_counter() - start > max_seconds:
+            break
+    result = summarize(samples)
+    result["rss_mb"] = rss_mb()
+    result["rss_delta_mb"] = result["rss_mb"] - rss_before
+    return result
+
+def cpu_stages(width, height, backend):
+    """(name, function, input kind) for every CPU stage at one resolution"""
+    stages = []
+    rov_dewarp = load_rov_dewarp()
+    if rov_dewarp is not None:
+        K = np.array([[FOCAL_PER_WIDTH * width, 0.0, width / 2],
+                      [0.0, FOCAL_PER_WIDTH * width, height / 2],
+                      [0.0, 0.0, 1.0]], dtype=np.float32)
+        dewarper = rov_dewarp.FisheyeDewarper(K, DISTORTION, (width, height))
+        half = rov_dewarp.FisheyeDewarper(K, DISTORTION, (width, height), (width // 2, height // 2))
+        remap_out = np.empty((height, width, 3), dtype=np.uint8)
+        half_out = np.empty((height // 2, width // 2, 3), dtype=np.uint8)
+        stages += [
+            ("remap", lambda f: dewarper(f, dst=remap_out), "uint8"),
+            ("remap_half", lambda f: half(f, dst=half_out), "uint8"),
+        ]
+    fast = FastMultiScaleRetinex()
+    streaming = StreamingRetinex()
+
+    stages += [
+        ("white_balance", lambda f: white_balance(f, backend=backend), "uint8"),
+        ("single_scale_retinex", lambda f: single_scale_retinex_gpu(f, 80, backend=backend), "float32"),
+        ("multi_scale_retinex", lambda f: multi_scale_retinex_gpu(f, backend=backend), "float32"),
+        ("underwater_retinex", lambda f: underwater_retinex_gpu(f, backend=backend), "uint8"),
+        ("underwater_retinex_fast", lambda f: underwater_retinex_gpu(f, msr=fast, backend=backend), "uint8"),
+        ("underwater_retinex_streaming", streaming, "uint8"),
+        ("underwater_retinex_numpy", lambda f: underwater_retinex_gpu(f, backend="numpy"), "uint8"),
+        ("underwater_retinex_tiled", lambda f: underwater_retinex_gpu(f, backend="tiled"), "uint8"),
+    ]
+    stages += [(f"denoise_{name}", denoiser, "uint8") for name, denoiser in DENOISERS.items() if name != "off"]
+    return stages
+
+def run_decode(width, height, duration, port, bitrate):
+    """Receive a local videotestsrc ! x264enc ! rtph264pay stream through GstreamerRTPSource"""
+    try:
+        from gi.repository import Gst
+        from interface import GstreamerRTPSource
+    except Exception as e:
+        return {"skipped": f"GStreamer receive path unavailable: {e}"}
+
+    source = GstreamerRTPSource(port=port, feedback=False, history_mode=None)
+    latencies = []
+    on_frame = source.stats.on_frame
+
+    def record(pipeline_latency=None, now=None):
+        if pipeline_latency is not None and pipeline_latency >= 0:
+            latencies.append(pipeline_latency)
+        on_frame(pipeline_latency, now)
+
+    source.stats.on_frame = record
+    sender = Gst.parse_launch(
+        f'videotestsrc is-live=true pattern=ball ! video/x-raw,width={width},height={height},framerate=30/1 ! '
+        f'x264enc tune=zerolatency speed-preset=ultrafast bitrate={bitrate} key-int-max=30 ! '
+        f'rtph264pay config-interval=1 pt=96 ! udpsink host=127.0.0.1 port={port}'
+    )
+
+    source.start()
+    rss_before = rss_mb()
+    sender.set_state(Gst.State.PLAYING)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    try:
+        time.sleep(duration)
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        sender.set_state(Gst.State.NULL)
+        source.stop()
+
+    if not latencies:
+        return {"skipped": "no frames decoded"}
+    result = summarize(latencies, wall)
+    result["cpu_percent"] = 100 * cpu / wall
+    result["rss_mb"] = rss_mb()
+    result["rss_delta_mb"] = result["rss_mb"] - rss_before
+    result["stats"] = source.get_stats()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold, out=None):
+    """Print p50 ratios against a baseline run; returns the stages slower than threshold"""
+    regressions = []
+    for resolution, stages in results["results"].items():
+        for stage, current in stages.items():
+            previous = baseline.get("results", {}).get(resolution, {}).get(stage)
+            if not previous or "p50_ms" not in previous or "p50_ms" not in current:
+                continue
+            ratio = current["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else float("inf")
+            flag = "  REGRESSION" if ratio > threshold else ""
+            print(f"{resolution:>6} {stage:<30} {previous['p50_ms']:9.2f} -> {current['p50_ms']:9.2f} ms "
+                  f"({ratio:.2f}x){flag}", file=out)
+            if ratio > threshold:
+                regressions.append(f"{resolution}/{stage}")
+    return regressions
+
+def main():
+    parser = ArgumentParser(description="Benchmark the camera-feed pipeline on synthetic frames and a loopback stream")
+    parser.add_argument('--resolutions', default="480p,720p,1080p",
+                        help=f"Comma-separated subset of {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--stages', help="Comma-separated stage names to run (default: all)")
+    parser.add_argument('--runs', type=int, default=30, help="Timed calls per stage")
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--max-seconds', type=float, default=10.0, help="Time budget per stage")
+    parser.add_argument('--backend', help="Retinex backend (cpu, opencl, cuda, auto)")
+    parser.add_argument('--decode-seconds', type=float, default=5.0,
+                        help="Length of the loopback decode run, 0 to skip it")
+    parser.add_argument('--port', type=int, default=5650)
+    parser.add_argument('--bitrate', type=int, default=4000)
+    parser.add_argument('--json', help="Write the results as JSON to this file ('-' for stdout)")
+    parser.add_argument('--compare', help="Baseline JSON from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="p50 slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    # With --json -, stdout carries only the JSON and everything else goes to stderr
+    log = sys.stderr if args.json == "-" else sys.stdout
+
+    backend = get_backend(args.backend).name
+    wanted = set(args.stages.split(",")) if args.stages else None
+    if load_rov_dewarp() is None:
+        print(f"Skipping the remap stages: {ROV_DEWARP} not found", file=log)
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "backend": backend,
+        "results": {},
+    }
+
+    for resolution in args.resolutions.split(","):
+        width, height = RESOLUTIONS[resolution]
+        frames = [make_test_frame(width, height, seed) for seed in range(4)]
+        inputs = {"uint8": frames, "float32": [frame.astype(np.float32) for frame in frames]}
+        stage_results = results["results"][resolution] = {}
+
+        for name, fn, kind in cpu_stages(width, height, backend):
+            if wanted is not None and name not in wanted:
+                continue
+            result = run_stage(fn, inputs[kind], args.runs, args.warmup, args.max_seconds)
+            stage_results[name] = result
+            print(f"{resolution:>6} {name:<30} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+                  f"{result['fps']:8.1f} fps  rss {result['rss_mb']:7.1f} MB", file=log)
+
+        if args.decode_seconds > 0 and (wanted is None or "decode" in wanted):
+            with contextlib.redirect_stdout(log):
+                result = run_decode(width, height, args.decode_seconds, args.port, args.bitrate)
+            stage_results["decode"] = result
+            if "skipped" in result:
+                print(f"{resolution:>6} {'decode':<30} skipped: {result['skipped']}", file=log)
+            else:
+                print(f"{resolution:>6} {'decode':<30} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+                      f"{result['fps']:8.1f} fps  cpu {result['cpu_percent']:5.1f}%", file=log)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    if args.json == "-":
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.json}", file=log)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, out=log)
+        if regressions:
+            print(f"FAIL: {len(regressions)} stage(s) slower than {args.threshold}x: {', '.join(regressions)}",
+                  file=log)
+            return 1
+        print("OK", file=log)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Import Retinex processing function
+from retinex import underwater_retinex_gpu
+from stage_timer import timer
+
+FORMATS = ("jpg", "png", "npy")
+
+class CaptureWriter:
+    """Saves captured frames as JPEG, PNG or .npy on a small thread pool so the Tk thread never blocks"""
+    def __init__(self, max_workers=2, max_in_flight=32, jpeg_quality=95, png_compression=1):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="capture-writer")
+        # Captures beyond max_in_flight queued frames are refused instead of stalling the live view
+        self.max_in_flight = max_in_flight
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.lock = threading.Lock()
+        # One Retinex at a time: the backends keep shared GPU buffers
+        self.retinex_lock = threading.Lock()
+        self.in_flight = 0
+        self.saved = 0
+        self.failed = 0
+
+    def submit(self, frames, directory, prefix, fmt="jpg", apply_retinex=False, denoise=None):
+        """Queue (frame, frame id) pairs for saving; returns False if the queue is full
+
+        File names carry the capture time to the millisecond plus the frame id,
+        so fast clicks and burst frames never overwrite each other.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown capture format '{fmt}', expected one of: {', '.join(FORMATS)}")
+        if not frames:
+            return True
+
+        with self.lock:
+            if self.in_flight + len(frames) > self.max_in_flight:
+                return False
+            self.in_flight += len(frames)
+
+        now = time.time()
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        for frame, frame_id in frames:
+            path = os.path.join(directory, f"{prefix}_{timestamp}_f{frame_id:06d}.{fmt}")
+            self.pool.submit(self._write, np.array(frame), path, fmt, apply_retinex, denoise)
+        return True
+
+    def _write(self, frame, path, fmt, apply_retinex, denoise):
+        try:
+            if apply_retinex:
+                with self.retinex_lock:
+                    started = timer.start()
+                    frame = underwater_retinex_gpu(frame, denoise=denoise)
+                    timer.stop("capture retinex", started)
+
+            started = timer.start()
+
+            if fmt == "npy":
+                np.save(path, frame)
+                ok = True
+            elif fmt == "png":
+                ok = cv2.imwrite(path, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                                 [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression])
+            else:
+                ok = cv2.imwrite(path, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                                 [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                raise IOError("imwrite failed")
+            timer.stop(f"capture write {fmt}", started)
+            with self.lock:
+                self.saved += 1
+        except Exception as e:
+            print(f"Error saving capture {path}: {e}")
+            with self.lock:
+                self.failed += 1
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    @property
+    def pending(self):
+        with self.lock:
+            return self.in_flight
+
+    def close(self, wait=True):
+        """Stop accepting captures, by default after the queued ones are written"""
+        self.pool.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,92 @@
+import os
+
+import cv2
+import numpy as np
+
+# Environment variable that picks the default denoise method
+DENOISE_ENV_VAR = "RETINEX_DENOISE"
+DEFAULT_DENOISE = "bilateral"
+
+def bilateral(img):
+    """Full-resolution bilateral filter, the original Retinex post-filter"""
+    return cv2.bilateralFilter(img, 9, 75, 75)
+
+def _box(img, radius):
+    return cv2.boxFilter(img, -1, (2 * radius + 1, 2 * radius + 1), borderType=cv2.BORDER_REFLECT)
+
+def _linear_coefficients(guide, target, radius, eps):
+    """Per-pixel a, b of the local linear model target ~ a * guide + b, box-averaged"""
+    mean_guide = _box(guide, radius)
+    mean_target = _box(target, radius)
+    cov = _box(guide * target, radius) - mean_guide * mean_target
+    var = _box(guide * guide, radius) - mean_guide * mean_guide
+    a = cov / (var + eps)
+    b = mean_target - a * mean_guide
+    return _box(a, radius), _box(b, radius)
+
+def _apply_upsampled(a, b, guide, shape):
+    """Upsample the coefficients to the full frame and apply them to the full-resolution guide"""
+    h, w = shape[:2]
+    if a.shape[:2] != (h, w):
+        a = cv2.resize(a, (w, h), interpolation=cv2.INTER_LINEAR)
+        b = cv2.resize(b, (w, h), interpolation=cv2.INTER_LINEAR)
+    out = a * guide
+    out += b
+    out *= 255.0
+    return cv2.convertScaleAbs(out)
+
+def guided(img, radius=4, eps=0.01, subsample=2):
+    """Self-guided filter (He et al.) per channel, with the coefficients fitted at 1/subsample size
+
+    Costs a handful of box filters whatever the radius; eps (on a 0..1 scale)
+    sets which edges survive, like the bilateral's sigma color.
+    """
+    full = img.astype(np.float32) * (1.0 / 255.0)
+    small = full
+    if subsample > 1:
+        small = cv2.resize(full, None, fx=1.0 / subsample, fy=1.0 / subsample, interpolation=cv2.INTER_AREA)
+    a, b = _linear_coefficients(small, small, max(1, radius // subsample), eps)
+    return _apply_upsampled(a, b, full, img.shape)
+
+def bilateral_lowres(img, factor=2, radius=2, eps=1e-4):
+    """Bilateral filter on a downscaled copy, joint-upsampled with the full frame as the guide
+
+    The low-resolution result is fitted as a local linear function of the
+    low-resolution input, and that fit is applied to the full-resolution
+    input, so edges stay sharp without running the bilateral at full size.
+    """
+    if factor <= 1:
+        return bilateral(img)
+    small = cv2.resize(img, None, fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
+    filtered = cv2.bilateralFilter(small, max(3, 9 // factor | 1), 75, 75 / factor)
+    guide = small.astype(np.float32) * (1.0 / 255.0)
+    target = filtered.astype(np.float32) * (1.0 / 255.0)
+    a, b = _linear_coefficients(guide, target, radius, eps)
+    return _apply_upsampled(a, b, img.astype(np.float32) * (1.0 / 255.0), img.shape)
+
+def off(img):
+    return img
+
+DENOISERS = {
+    "bilateral": bilateral,
+    "guided": guided,
+    "bilateral_lowres": bilateral_lowres,
+    "off": off,
+}
+
+def default_method():
+    """Denoise method from the RETINEX_DENOISE env var, or the default bilateral"""
+    return os.environ.get(DENOISE_ENV_VAR, DEFAULT_DENOISE).lower()
+
+def get_denoiser(name=None):
+    """Get a denoise function by name, the RETINEX_DENOISE env var, or the default bilateral"""
+    if name is None:
+        name = default_method()
+    name = name.lower()
+    if name not in DENOISERS:
+        raise ValueError(f"Unknown denoise method {name!r}, expected one of {', '.join(DENOISERS)}")
+    return DENOISERS[name]
+
+def denoise(img, method=None):
+    """Edge-preserving denoise of a uint8 Retinex output"""
+    return get_denoiser(method)(img)
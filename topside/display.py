@@ -0,0 +1,114 @@
+import os
+import tkinter as tk
+
+import cv2
+
+# PIL is only needed by the pil and paste backends
+try:
+    from PIL import Image, ImageTk
+except ImportError:
+    Image = ImageTk = None
+
+# Environment variable that picks the display backend at startup
+DISPLAY_ENV_VAR = "DISPLAY_BACKEND"
+DEFAULT_DISPLAY = "ppm"
+
+class FeedDisplay:
+    """Base of the display backends, which draw RGB frames into a Tk label with show(frame)"""
+    name = None
+
+    def __init__(self, label, max_size=(522, 928)):
+        self.label = label
+        # Bounds the picture until the window has been laid out
+        self.max_size = max_size
+
+    def fit(self, frame):
+        """Downscale (never enlarge) a frame into the visible box, so the Tcl transfer follows the screen size"""
+        box_w, box_h = self.max_size
+        parent = self.label.master
+        if parent.winfo_ismapped() and parent.winfo_width() > 1:
+            box_w = min(box_w, parent.winfo_width())
+        h, w = frame.shape[:2]
+        scale = min(box_w / w, box_h / h)
+        if scale >= 1.0:
+            return frame
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def clear(self):
+        self.label.config(image='')
+
+class PilDisplay(FeedDisplay):
+    """New PIL image and PhotoImage for every frame (the original path)"""
+    name = "pil"
+
+    def show(self, frame):
+        img = ImageTk.PhotoImage(image=Image.fromarray(self.fit(frame)))
+        self.label.config(image=img)
+        self.label.image = img  # Keep a reference to prevent garbage collection
+
+class PasteDisplay(FeedDisplay):
+    """One PhotoImage per feed, updated in place with paste()"""
+    name = "paste"
+
+    def __init__(self, label, max_size=(522, 928)):
+        super().__init__(label, max_size)
+        self.photo = None
+        self.size = None
+
+    def show(self, frame):
+        frame = self.fit(frame)
+        h, w = frame.shape[:2]
+        image = Image.fromarray(frame)
+        if self.photo is None or self.size != (w, h):
+            self.photo = ImageTk.PhotoImage(image=image)
+            self.size = (w, h)
+            self.label.config(image=self.photo)
+            self.label.image = self.photo
+        else:
+            self.photo.paste(image)
+
+    def clear(self):
+        super().clear()
+        self.photo = None
+        self.size = None
+
+class PpmDisplay(FeedDisplay):
+    """One Tk photo per feed, reloaded from raw PPM bytes without going through PIL"""
+    name = "ppm"
+
+    def __init__(self, label, max_size=(522, 928)):
+        super().__init__(label, max_size)
+        self.photo = None
+
+    def show(self, frame):
+        frame = self.fit(frame)
+        h, w = frame.shape[:2]
+        data = b"P6 %d %d 255\n" % (w, h) + frame.tobytes()
+        if self.photo is None:
+            self.photo = tk.PhotoImage(master=self.label, data=data, format="PPM")
+            self.label.config(image=self.photo)
+        else:
+            self.photo.configure(data=data, format="PPM")
+
+    def clear(self):
+        super().clear()
+        self.photo = None
+
+DISPLAYS = {
+    "ppm": PpmDisplay,
+    "paste": PasteDisplay,
+    "pil": PilDisplay,
+}
+
+def make_display(label, name=None, max_size=(522, 928)):
+    """Create the display backend by name or the DISPLAY_BACKEND env var"""
+    if name is None:
+        name = os.environ.get(DISPLAY_ENV_VAR, DEFAULT_DISPLAY)
+    name = name.lower()
+    if name not in DISPLAYS:
+        raise ValueError(f"Unknown display backend {name!r}, expected one of {', '.join(DISPLAYS)}")
+    if name != "ppm" and ImageTk is None:
+        print(f"PIL is not installed, using the ppm display instead of {name}")
+        name = "ppm"
+    return DISPLAYS[name](label, max_size)
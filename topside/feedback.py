@@ -0,0 +1,60 @@
+import json
+import socket
+
+# The ROV listens for receive reports on the video port plus this offset
+FEEDBACK_PORT_OFFSET = 100
+
+class FeedbackSender:
+    """Sends periodic receive reports back to the ROV so it can adapt its bitrate
+
+    Loss is reported per interval rather than cumulatively, so the ROV reacts
+    to the current state of the tether.
+    """
+    def __init__(self, port, host=None):
+        self.port = port + FEEDBACK_PORT_OFFSET
+        self.host = host
+        self.sock = None
+        self.last_expected = 0
+        self.last_lost = 0
+
+    def retarget(self, port, host=None):
+        """Report for another video port, starting the loss intervals over"""
+        self.port = port + FEEDBACK_PORT_OFFSET
+        self.host = host
+        self.last_expected = 0
+        self.last_lost = 0
+
+    def report(self, stats):
+        """Build an interval report from a ReceiveStats snapshot"""
+        expected = stats["packets_expected"] - self.last_expected
+        lost = stats["packets_lost"] - self.last_lost
+        self.last_expected = stats["packets_expected"]
+        self.last_lost = stats["packets_lost"]
+        return {
+            "loss": 100.0 * max(lost, 0) / expected if expected > 0 else 0.0,
+            "delay_ms": stats["network_delay_ms"],
+            "latency_ms": stats["glass_latency_ms"],
+            "fps": stats["decode_fps"],
+        }
+
+    def send(self, stats):
+        """Send one report and return it, or None until the ROV's address is known"""
+        report = self.report(stats)
+        if self.host is None:
+            return None
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.sendto(json.dumps(report).encode(), (self.host, self.port))
+        except OSError as e:
+            print(f"Failed to send feedback to {self.host}:{self.port}: {e}")
+            return None
+        return report
+
+    def close(self):
+        """Close the socket; the next send() opens a new one"""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.last_expected = 0
+        self.last_lost = 0
@@ -0,0 +1,84 @@
+import threading
+
+import numpy as np
+
+class FrameRing:
+    """Fixed ring of preallocated frames tagged with sequence numbers
+
+    The producer copies each decoded frame into the next slot once; consumers
+    get read-only views into the ring plus the frame id instead of copies. A
+    view stays valid until size newer frames have been written, so anything
+    that holds on to a frame longer than that must copy it.
+    """
+    def __init__(self, size=8):
+        self.size = size
+        self.lock = threading.Lock()
+        self.slots = []
+        self.slot_ids = [0] * size
+        self.slot_pts = [None] * size
+        self.shape = None
+        self.seq = 0
+
+    def _allocate(self, shape):
+        """(Re)allocate the slots for a new frame shape; old views stay alive"""
+        self.shape = shape
+        self.slots = [np.empty(shape, dtype=np.uint8) for _ in range(self.size)]
+        self.slot_ids = [0] * self.size
+        self.slot_pts = [None] * self.size
+
+    def write(self, src, pts=None):
+        """Copy a frame into the next slot and return its frame id"""
+        if src.shape != self.shape:
+            with self.lock:
+                self._allocate(src.shape)
+
+        # The slot after the latest one is never handed out as the newest frame
+        frame_id = self.seq + 1
+        index = frame_id % self.size
+        slot = self.slots[index]
+        np.copyto(slot, src)
+
+        with self.lock:
+            self.slot_ids[index] = frame_id
+            self.slot_pts[index] = pts
+            self.seq = frame_id
+        return frame_id
+
+    def _view(self, index):
+        view = self.slots[index].view()
+        view.flags.writeable = False
+        return view
+
+    def latest(self):
+        """Get (read-only view, frame id) of the newest frame, or (None, 0)"""
+        with self.lock:
+            if self.seq == 0:
+                return None, 0
+            return self._view(self.seq % self.size), self.seq
+
+    def get(self, frame_id):
+        """Get a read-only view of a frame by id, or None if it was overwritten"""
+        with self.lock:
+            index = frame_id % self.size
+            if frame_id <= 0 or self.slot_ids[index] != frame_id:
+                return None
+            return self._view(index)
+
+    def pts(self, frame_id):
+        """Get the presentation timestamp stored with a frame, or None"""
+        with self.lock:
+            index = frame_id % self.size
+            if frame_id <= 0 or self.slot_ids[index] != frame_id:
+                return None
+            return self.slot_pts[index]
+
+    def recent(self, count):
+        """Get up to count (view, frame id) pairs, oldest first"""
+        with self.lock:
+            first = max(self.seq - count + 1, self.seq - self.size + 2, 1)
+            frames = []
+            for frame_id in range(first, self.seq + 1):
+                index = frame_id % self.size
+                if self.slot_ids[index] == frame_id:
+                    frames.append((self._view(index), frame_id))
+            return frames
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# H.264 SEI NAL unit type and the payload type of a recovery point message
+NAL_SEI = 6
+SEI_RECOVERY_POINT = 6
+
+def nal_units(data):
+    """The NAL units of an Annex B access unit, without their start codes"""
+    starts = []
+    i = data.find(b"\x00\x00\x01")
+    while i >= 0:
+        starts.append(i + 3)
+        i = data.find(b"\x00\x00\x01", i + 3)
+    for start, end in zip(starts, starts[1:] + [len(data) + 3]):
+        # A 4-byte start code leaves its leading zero on the previous unit
+        yield data[start:end - 3].rstrip(b"\x00")
+
+def sei_payload_types(nal):
+    """Payload types of the messages in an SEI NAL unit"""
+    rbsp = nal[1:].replace(b"\x00\x00\x03", b"\x00\x00")
+    i = 0
+    try:
+        # Stop at the rbsp trailing bits
+        while i < len(rbsp) and rbsp[i] != 0x80:
+            values = []
+            for _ in range(2):  # payload type, then payload size
+                value = 0
+                while rbsp[i] == 0xFF:
+                    value += 255
+                    i += 1
+                values.append(value + rbsp[i])
+                i += 1
+            yield values[0]
+            i += values[1]
+    except IndexError:
+        return
+
+def is_recovery_point(data):
+    """Whether an Annex B access unit carries a recovery point SEI
+
+    x264 with intra-refresh sends one (with SPS/PPS) every key-int-max
+    frames instead of an IDR, so these are the stream's sync points.
+    """
+    return any(nal and nal[0] & 0x1F == NAL_SEI and SEI_RECOVERY_POINT in sei_payload_types(nal)
+               for nal in nal_units(data))
+
+class FrameHistory:
+    """Rolling window of the last seconds of a feed under max_bytes, trimmed a GOP at a time from a keyframe"""
+    def __init__(self, seconds=30, max_bytes=64 * 1024 * 1024):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = deque()
+        self.keyframes = 0
+        self.bytes = 0
+
+    def append(self, item, size, keyframe=True, now=None):
+        """Add one entry, trimming the front to stay inside the budget"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            # Nothing before the first keyframe can be decoded
+            if not self.entries and not keyframe:
+                return
+            self.entries.append((now, item, size, keyframe))
+            self.bytes += size
+            self.keyframes += keyframe
+            while self.keyframes > 1 and (self.bytes > self.max_bytes or now - self.entries[0][0] > self.seconds):
+                self._drop_gop()
+            # A single GOP over budget (no sync point for max_bytes): start again at the next one
+            if self.bytes > self.max_bytes:
+                self.entries.clear()
+                self.keyframes = 0
+                self.bytes = 0
+
+    def _drop_gop(self):
+        """Drop the oldest keyframe and the delta frames that depend on it"""
+        _, _, size, _ = self.entries.popleft()
+        self.bytes -= size
+        self.keyframes -= 1
+        while self.entries and not self.entries[0][3]:
+            _, _, size, _ = self.entries.popleft()
+            self.bytes -= size
+
+    def window(self):
+        """Get a list of the buffered (arrival time, item, size, keyframe) entries"""
+        with self.lock:
+            return list(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keyframes = 0
+            self.bytes = 0
+
+    def usage(self):
+        """(bytes, seconds, entries) currently buffered"""
+        with self.lock:
+            if not self.entries:
+                return 0, 0.0, 0
+            return self.bytes, self.entries[-1][0] - self.entries[0][0], len(self.entries)
+
+    def summary(self):
+        """Short usage summary for the status labels"""
+        size, seconds, _ = self.usage()
+        return f"Buffer {seconds:.0f} s, {size / 1e6:.1f}/{self.max_bytes / 1e6:.0f} MB"
+
+def write_encoded(entries, path):
+    """Write buffered H.264 access units (Annex B byte-stream) to a playable .h264 file"""
+    with open(path, "wb") as f:
+        for _, data, _, _ in entries:
+            f.write(data)
+
+def write_decoded(entries, path):
+    """Write buffered RGB frames to an MJPEG .avi at their average rate"""
+    if not entries:
+        return
+    duration = entries[-1][0] - entries[0][0]
+    fps = (len(entries) - 1) / duration if duration > 0 else 30.0
+    h, w = entries[0][1].shape[:2]
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+    try:
+        for _, frame, _, _ in entries:
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    finally:
+        writer.release()
+
+def save_history(history, path, encoded):
+    """Dump the current window to path on a background thread and return the thread"""
+    entries = history.window()
+    writer = write_encoded if encoded else write_decoded
+
+    def run():
+        try:
+            writer(entries, path)
+            print(f"Saved {len(entries)} buffered frames to {path}")
+        except Exception as e:
+            print(f"Error saving buffered frames to {path}: {e}")
+
+    thread = threading.Thread(target=run, name="history-writer", daemon=True)
+    thread.start()
+    return thread
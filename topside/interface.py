@@ -2,10 +2,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import cv2
 import numpy as np
-from PIL import Image, ImageTk
 import os
 import time
-import threading
 import gi
 from pathlib import Path
 
@@ -16,25 +14,105 @@ from gi.repository import Gst, GLib
 # Initialize GStreamer
 Gst.init(None)
 
-# Import Retinex processing function
-from retinex import underwater_retinex_gpu
+# GstNet tells us which host the RTP packets come from, for the feedback channel
+try:
+    gi.require_version('GstNet', '1.0')
+    from gi.repository import GstNet
+except (ImportError, ValueError):
+    GstNet = None
+
+from processing import RetinexWorker
+from retinex import StreamingRetinex
+from denoise import DENOISERS, default_method, get_denoiser
+from stage_timer import profiler, timer
+from display import make_display
+from notify import FrameNotifier
+from frame_ring import FrameRing
+from stream_manager import StreamManager
+from rtp_stats import ReceiveStats
+from feedback import FeedbackSender
+from recorder import StreamRecorder
+from capture_writer import FORMATS, CaptureWriter
+from history import FrameHistory, is_recovery_point, save_history
+
+# Feeds redraw on frame arrival; this slower poll only refreshes stalled feeds and their status
+STALL_POLL_MS = 250
 
 class GstreamerRTPSource:
-    """Class to handle GStreamer RTP video source"""
-    def __init__(self, port=5000):
+    """Class to handle GStreamer RTP video source, run as one bin in a shared StreamManager pipeline"""
+    def __init__(self, port=5000, decoder="avdec_h264", decoder_threads=0, flip_method="clockwise",
+                 display_width=522, capture_branch=True, capture_ring_size=8, jitter_latency=50,
+                 udp_buffer_size=4 * 1024 * 1024, feedback=True, feedback_host=None,
+                 record_dir=None, record_muxer="matroska", record_segment_time=300, record_segment_bytes=0,
+                 history_mode="encoded", history_seconds=30, history_bytes=64 * 1024 * 1024, history_scale=0.5,
+                 denoise=None, manager=None):
         self.port = port
-        self.frame = None
-        self.lock = threading.Lock()
+
+        # Shared pipeline and main loop; a source without one starts its own
+        self.manager = manager
+        self.owns_manager = manager is None
+
+        # Last history_seconds of the feed, up to history_bytes, for "save the last N seconds":
+        # "encoded" keeps H.264 access units, "decoded" keeps display frames scaled by history_scale
+        self.history_mode = history_mode
+        self.history_scale = history_scale
+        self.history = FrameHistory(history_seconds, history_bytes) if history_mode else None
+
+        # The H.264 is recorded as-is off a tee (see StreamRecorder); with record_dir set,
+        # recording starts with the feed
+        self.record_dir = record_dir
+        self.record_muxer = record_muxer
+        self.record_segment_time = record_segment_time
+        self.record_segment_bytes = record_segment_bytes
+        self.recorder = None
+
+        # Receive reports to the ROV once a second for its bitrate control; the host is learned from the packets
+        self.feedback_host = feedback_host
+        self.feedback = FeedbackSender(port, feedback_host) if feedback else None
+        self.feedback_timer = None
+
+        # jitter_latency (ms) for the rtpjitterbuffer in front of the depayloader, None for none
+        self.jitter_latency = jitter_latency
+        self.udp_buffer_size = udp_buffer_size
+        self.stats = ReceiveStats()
+        self.last_jitter_poll = 0.0
+
+        # decoder is a pipeline fragment (e.g. "avdec_h264", "v4l2h264dec" or "vaapih264dec ! vaapipostproc");
+        # decoder_threads sets avdec's max-threads (0 = one per core)
+        self.decoder = decoder
+        self.decoder_threads = decoder_threads
+
+        # Display frames are scaled and rotated in GStreamer; the optional full-resolution
+        # capture branch keeps the last capture_ring_size frames for burst captures
+        self.flip_method = flip_method
+        self.display_width = display_width
+        self.capture_branch = capture_branch
+        self.ring = FrameRing()
+        self.capture_ring = FrameRing(capture_ring_size) if capture_branch else None
+        self.last_pts = None
         self.running = False
-        self.pipeline = None
-        self.loop = None
-        self.loop_thread = None
+        self.branch = None
+
+        # denoise picks the filter at the end of this feed's Retinex (see denoise.py)
+        self.denoise = denoise
+        self.processor = RetinexWorker(StreamingRetinex(denoise=denoise), name=f"port{port}")
+
+        # Called with no arguments from GStreamer or the Retinex worker when a new frame is ready
+        self.on_frame = None
+
+        # Stage names for the timing layer, built once per port
+        self._set_stage_names()
+
+    def _set_stage_names(self):
+        self.display_stage = f"port{self.port} display sample"
+        self.capture_stage = f"port{self.port} capture sample"
+        self.processor.stage = f"port{self.port} retinex"
         
-    def on_new_sample(self, sink):
-        """Callback for new video samples"""
+    def _write_sample(self, sink, ring):
+        """Pull a sample from an appsink into a frame ring, returning the frame id or None"""
         sample = sink.emit("pull-sample")
         if not sample:
-            return Gst.FlowReturn.ERROR
+            return None
             
         buf = sample.get_buffer()
         caps = sample.get_caps()
@@ -45,72 +123,351 @@ class GstreamerRTPSource:
         
         success, map_info = buf.map(Gst.MapFlags.READ)
         if not success:
-            return Gst.FlowReturn.ERROR
+            return None
             
-        # Create a copy of the numpy array to avoid issues when buffer is unmapped
-        # Reshape based on frame dimensions
-        new_frame = np.frombuffer(map_info.data, dtype=np.uint8).reshape((height, width, 3)).copy()
-        
-        # Update the current frame thread-safely
-        with self.lock:
-            self.frame = new_frame
+        # Wrap the mapped buffer (rows may be padded) and copy it once into the ring
+        data = np.frombuffer(map_info.data, dtype=np.uint8)
+        stride = data.size // height
+        src = data[:stride * height].reshape((height, stride))[:, :width * 3].reshape((height, width, 3))
+        frame_id = ring.write(src, pts=buf.pts)
             
         # Unmap buffer
         buf.unmap(map_info)
+        return frame_id
+
+    def on_new_sample(self, sink):
+        """Callback for new display-size video samples"""
+        started = timer.start()
+        frame_id = self._write_sample(sink, self.ring)
+        timer.stop(self.display_stage, started)
+        if frame_id is None:
+            return Gst.FlowReturn.ERROR
+        self.last_pts = self.ring.pts(frame_id)
+
+        # Receive-to-sink latency from the buffer's running time
+        latency = None
+        branch = self.branch
+        clock = branch.get_clock() if branch is not None else None
+        if clock is not None and self.last_pts is not None and self.last_pts != Gst.CLOCK_TIME_NONE:
+            running_time = clock.get_time() - branch.get_base_time()
+            latency = (running_time - self.last_pts) / Gst.SECOND
+        self.stats.on_frame(latency)
+
+        # Hand the newest frame to the background Retinex stage
+        frame = self.ring.get(frame_id)
+        self.processor.submit(frame, frame_id)
+        if self.on_frame is not None:
+            self.on_frame()
+
+        # Keep a downscaled copy for the decoded history
+        if self.history_mode == "decoded" and frame is not None:
+            if self.history_scale != 1.0:
+                frame = cv2.resize(frame, None, fx=self.history_scale, fy=self.history_scale,
+                                   interpolation=cv2.INTER_AREA)
+            else:
+                frame = frame.copy()
+            self.history.append(frame, frame.nbytes)
+        return Gst.FlowReturn.OK
+
+    def on_new_history_sample(self, sink):
+        """Callback for encoded access units from before the decoder"""
+        sample = sink.emit("pull-sample")
+        if not sample:
+            return Gst.FlowReturn.ERROR
+        buf = sample.get_buffer()
+        data = buf.extract_dup(0, buf.get_size())
+        # The ROV's intra-refresh stream has one IDR; its recovery points are the later sync points
+        keyframe = not buf.has_flags(Gst.BufferFlags.DELTA_UNIT) or is_recovery_point(data)
+        self.history.append(data, len(data), keyframe=keyframe)
+        return Gst.FlowReturn.OK
+
+    def on_new_capture_sample(self, sink):
+        """Callback for new full-resolution video samples"""
+        started = timer.start()
+        frame_id = self._write_sample(sink, self.capture_ring)
+        timer.stop(self.capture_stage, started)
+        if frame_id is None:
+            return Gst.FlowReturn.ERROR
         return Gst.FlowReturn.OK
+
+    def on_rtp_packet(self, pad, info):
+        """Pad probe on udpsrc that feeds RTP sequence numbers and timestamps to the stats"""
+        buf = info.get_buffer()
+        if buf is not None and buf.get_size() >= 8:
+            header = buf.extract_dup(0, 8)
+            self.stats.on_packet(int.from_bytes(header[2:4], "big"), int.from_bytes(header[4:8], "big"))
+
+            # Learn the ROV's address for the feedback channel from the first packet
+            if self.feedback is not None and self.feedback.host is None and GstNet is not None:
+                meta = GstNet.buffer_get_net_address_meta(buf)
+                if meta is not None:
+                    self.feedback.host = meta.addr.get_address().to_string()
+        return Gst.PadProbeReturn.OK
+
+    def send_feedback(self):
+        """GLib timer callback that sends a receive report to the ROV"""
+        if not self.running:
+            return False
+        self.feedback.send(self.get_stats())
+        return True
+
+    def get_stats(self):
+        """Get the receive counters, refreshing the jitterbuffer's at most twice a second"""
+        now = time.monotonic()
+        branch = self.branch
+        if branch is not None and self.jitter_latency is not None and now - self.last_jitter_poll > 0.5:
+            self.last_jitter_poll = now
+            jitterbuffer = branch.get_by_name("jitter")
+            if jitterbuffer is not None:
+                self.stats.update_jitterbuffer(jitterbuffer.get_property("stats"))
+        return self.stats.snapshot()
+
+    def stats_text(self):
+        """Short receive summary for the status labels"""
+        self.get_stats()
+        summary = self.stats.summary()
+        if self.history is not None:
+            summary += f" | {self.history.summary()}"
+        if self.recording:
+            summary += f" | {self.recorder.summary()}"
+        return summary
+
+    @property
+    def recording(self):
+        return self.recorder is not None and self.recorder.recording
+
+    def start_recording(self, directory=None):
+        """Start recording the received H.264 without re-encoding"""
+        if directory is not None:
+            self.record_dir = directory
+        if self.branch is None or self.record_dir is None or self.recording:
+            return
+        if self.recorder is not None and not self.recorder.wait(2.0):
+            print(f"Previous recording on port {self.port} did not finish in time")
+            self.recorder.abort()
+        self.recorder = StreamRecorder(self.branch, self.branch.get_by_name("raw"), self.record_dir,
+                                       f"port{self.port}", muxer=self.record_muxer,
+                                       segment_time=self.record_segment_time,
+                                       segment_bytes=self.record_segment_bytes)
+        self.recorder.start()
+        print(f"Recording port {self.port} to {self.record_dir}")
+
+    def set_denoise(self, method):
+        """Switch this feed's Retinex denoise method; takes effect on the next frame"""
+        get_denoiser(method)
+        self.denoise = method
+        self.processor.process_fn.denoise = method
+
+    def save_history(self, directory):
+        """Dump the buffered last seconds of the feed to disk in the background; returns the path"""
+        if self.history is None:
+            return None
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        extension = "h264" if self.history_mode == "encoded" else "avi"
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        path = Path(directory) / f"port{self.port}_history_{timestamp}.{extension}"
+        save_history(self.history, path, encoded=self.history_mode == "encoded")
+        return path
+
+    def stop_recording(self):
+        """Stop recording; the last segment is closed in the background"""
+        if self.recording:
+            self.recorder.stop()
+            print(f"Stopped recording port {self.port}")
+
+    def build_pipeline_string(self):
+        """Build the receive pipeline from the source settings"""
+        decoder = self.decoder
+        if decoder.startswith("avdec_"):
+            decoder += f" max-threads={self.decoder_threads}"
+
+        # Scale before rotating so the flip only touches display-size frames
+        display = "videoscale ! " if self.display_width else ""
+        display += f"videoflip method={self.flip_method} ! videoconvert ! video/x-raw,format=RGB"
+        if self.display_width:
+            display += f",width={self.display_width},pixel-aspect-ratio=1/1"
+        display += " ! appsink name=sink emit-signals=true max-buffers=1 drop=true"
+
+        pipeline_str = (
+            f'udpsrc name=src port={self.port} buffer-size={self.udp_buffer_size} '
+            'caps=application/x-rtp,media=video,clock-rate=90000,encoding-name=H264,payload=96 ! '
+        )
+        if self.jitter_latency is not None:
+            pipeline_str += (
+                f'rtpjitterbuffer name=jitter latency={self.jitter_latency} '
+                'drop-on-latency=true do-lost=true ! '
+            )
+        # Tee the parsed H.264 for recording; SPS/PPS are repeated so segments can start at any keyframe
+        pipeline_str += f'rtph264depay ! h264parse config-interval=-1 ! tee name=raw ! {decoder} ! '
+        if not self.capture_branch:
+            pipeline_str += display
+        else:
+            # Full-resolution capture branch off a tee
+            pipeline_str += (
+                'tee name=t ! '
+                f'queue leaky=downstream max-size-buffers=1 ! {display} '
+                't. ! queue leaky=downstream max-size-buffers=1 ! '
+                f'videoflip method={self.flip_method} ! videoconvert ! video/x-raw,format=RGB ! '
+                'appsink name=capture_sink emit-signals=true max-buffers=1 drop=true'
+            )
+
+        if self.history_mode == "encoded":
+            # Access units in Annex B form so the dumped history plays as a plain .h264 file
+            pipeline_str += (
+                ' raw. ! queue leaky=downstream max-size-buffers=30 ! h264parse ! '
+                'video/x-h264,stream-format=byte-stream,alignment=au ! '
+                'appsink name=history_sink emit-signals=true sync=false'
+            )
+        return pipeline_str
     
+    def _add_branch(self):
+        """Build this feed's bin and add it to the shared pipeline"""
+        self.stats.reset()
+        self.last_pts = None
+        branch = Gst.parse_bin_from_description(self.build_pipeline_string(), False)
+        branch.set_name(f"port{self.port}")
+        udpsrc = branch.get_by_name("src")
+        udpsrc.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.on_rtp_packet)
+        appsink = branch.get_by_name("sink")
+        appsink.connect("new-sample", profiler.wrap(self.on_new_sample))
+        if self.capture_branch:
+            capture_sink = branch.get_by_name("capture_sink")
+            capture_sink.connect("new-sample", profiler.wrap(self.on_new_capture_sample))
+        if self.history is not None:
+            self.history.clear()
+        if self.history_mode == "encoded":
+            history_sink = branch.get_by_name("history_sink")
+            history_sink.connect("new-sample", profiler.wrap(self.on_new_history_sample))
+
+        # Set before the bin starts so the first samples can read the clock from it
+        self.branch = branch
+        try:
+            self.manager.add(branch)
+        except Exception:
+            self.branch = None
+            raise
+
+        # Report receive stats back to the ROV once a second
+        if self.feedback is not None:
+            self.feedback_timer = GLib.timeout_add_seconds(1, self.send_feedback)
+
+    def _remove_branch(self):
+        """Close any recording and take this feed's bin out of the shared pipeline"""
+        # Close the recording while the main loop can still finish it
+        if self.recorder is not None:
+            self.recorder.stop()
+            if not self.recorder.wait(2.0):
+                print(f"Recording on port {self.port} did not finish cleanly")
+                self.recorder.abort()
+            self.recorder = None
+
+        # Stop reporting to the ROV
+        if self.feedback_timer is not None:
+            GLib.source_remove(self.feedback_timer)
+            self.feedback_timer = None
+
+        if self.branch is not None:
+            self.manager.remove(self.branch)
+            self.branch = None
+
     def start(self):
-        """Start the GStreamer pipeline"""
+        """Add this feed to the shared pipeline (starting a private one if there is no manager)"""
         if self.running:
             return
-            
-        # Create GStreamer pipeline
-        pipeline_str = (
-            f'udpsrc port={self.port} caps=application/x-rtp,encoding-name=H264,payload=96 ! '
-            'rtph264depay ! avdec_h264 ! videoconvert ! '
-            'videoflip method=clockwise ! '
-            'video/x-raw,format=BGR ! appsink name=sink emit-signals=true max-buffers=1 drop=true'
-        )
-        
-        self.pipeline = Gst.parse_launch(pipeline_str)
-        appsink = self.pipeline.get_by_name("sink")
-        appsink.connect("new-sample", self.on_new_sample)
-        
-        # Start the pipeline
-        self.pipeline.set_state(Gst.State.PLAYING)
-        
-        # Create and start GLib main loop in a separate thread
-        self.loop = GLib.MainLoop()
-        self.loop_thread = threading.Thread(target=self.loop.run)
-        self.loop_thread.daemon = True
-        self.loop_thread.start()
+        if self.manager is None:
+            self.manager = StreamManager(f"port{self.port}")
+        self.manager.start()
+        self._add_branch()
+
+        # Start the background processing stage
+        self.processor.start()
         
         self.running = True
         print(f"GStreamer RTP source started on port {self.port}")
+
+        if self.record_dir is not None:
+            self.start_recording()
+
+    def reconnect(self, port):
+        """Switch to another port, rebuilding only this feed's bin
+
+        The Retinex worker, frame rings and callbacks carry over, so this takes
+        milliseconds rather than a pipeline and main loop restart.
+        """
+        started = time.perf_counter()
+        if self.running:
+            self._remove_branch()
+        self.port = port
+        self._set_stage_names()
+        if self.feedback is not None:
+            self.feedback.retarget(port, self.feedback_host)
+        if not self.running:
+            return
+
+        try:
+            self._add_branch()
+        except Exception:
+            self.processor.stop()
+            self.running = False
+            raise
+        print(f"GStreamer RTP source moved to port {port} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        if self.record_dir is not None:
+            self.start_recording()
     
+    def set_frame_callback(self, callback):
+        """Call callback() whenever a new decoded frame or Retinex result is ready"""
+        self.on_frame = callback
+        self.processor.on_result = callback
+
     def get_frame(self):
-        """Get the current frame thread-safely"""
-        with self.lock:
-            if self.frame is not None:
-                return self.frame.copy()
-            return None
+        """Get a read-only RGB view of the current frame"""
+        frame, _ = self.ring.latest()
+        return frame
+
+    def get_latest(self):
+        """Get (read-only RGB view, frame id) of the current frame"""
+        return self.ring.latest()
+
+    def get_capture_frame(self):
+        """Get a read-only RGB view of the current full-resolution frame"""
+        if self.capture_ring is None:
+            return self.get_frame()
+        frame, _ = self.capture_ring.latest()
+        return frame
+
+    def get_capture_frames(self, count):
+        """Get up to count recent full-resolution (read-only RGB view, frame id) pairs, oldest first"""
+        ring = self.capture_ring if self.capture_ring is not None else self.ring
+        return ring.recent(count)
+
+    @property
+    def max_burst(self):
+        """Most frames a burst capture can get; a ring hands out at most size - 1, the last slot being written next"""
+        ring = self.capture_ring if self.capture_ring is not None else self.ring
+        return ring.size - 1
+
+    @property
+    def frame_count(self):
+        """Monotonically increasing count of decoded frames"""
+        return self.ring.seq
     
     def stop(self):
-        """Stop the GStreamer pipeline"""
+        """Take this feed out of the shared pipeline (stopping it too if the source owns it)"""
         if not self.running:
             return
-            
-        # Quit the GLib main loop
-        if self.loop and self.loop.is_running():
-            self.loop.quit()
-            
-        # Wait for the loop thread to finish
-        if self.loop_thread and self.loop_thread.is_alive():
-            self.loop_thread.join(timeout=1.0)
-            
-        # Stop the pipeline
-        if self.pipeline:
-            self.pipeline.set_state(Gst.State.NULL)
+
+        self._remove_branch()
+        if self.feedback is not None:
+            self.feedback.close()
+
+        # A private pipeline and main loop go with the source
+        if self.owns_manager:
+            self.manager.stop()
+            self.manager = None
+
+        # Stop the background processing stage
+        self.processor.stop()
             
         self.running = False
         print(f"GStreamer RTP source stopped on port {self.port}")
@@ -119,15 +476,26 @@ class CameraCaptureApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Dual RTP Camera Feed with Retinex")
-                
-        # Initialize GStreamer video sources
-        self.rtp_source1 = GstreamerRTPSource(port=5000)
-        self.rtp_source2 = GstreamerRTPSource(port=5001)
         
         # Create directory for saved frames
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         self.output_dir = Path("captured_frames") / f"output_{timestamp}"
         self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        # Captures are written in the background
+        self.capture_writer = CaptureWriter()
+
+        # Feeds are redrawn when their sources report a new frame; the poll only catches stalls
+        self.notifier = FrameNotifier(root, self.on_frames_ready)
+        self.display_latency = {"Feed 1": 0.0, "Feed 2": 0.0}
+
+        # Both feeds share one pipeline and GLib main loop; connecting only swaps a feed's branch
+        self.stream_manager = StreamManager()
+        self.stream_manager.start()
+        self.rtp_source1 = GstreamerRTPSource(port=5000, manager=self.stream_manager)
+        self.rtp_source2 = GstreamerRTPSource(port=5001, manager=self.stream_manager)
+        self.rtp_source1.set_frame_callback(lambda: self.notifier.notify("Feed 1"))
+        self.rtp_source2.set_frame_callback(lambda: self.notifier.notify("Feed 2"))
         
         # Create main frame
         self.main_frame = ttk.Frame(root)
@@ -156,6 +524,12 @@ class CameraCaptureApp:
 
         self.status_label2 = ttk.Label(self.right_cam_frame, text="")
         self.status_label2.pack(padx=0, pady=0)
+
+        # One persistent image per feed, redrawn in place (DISPLAY_BACKEND picks how)
+        self.displays = {
+            "Feed 1": make_display(self.cam_label1),
+            "Feed 2": make_display(self.cam_label2),
+        }
         
         # Control panel
         self.control_frame = ttk.Frame(root)
@@ -205,6 +579,34 @@ class CameraCaptureApp:
         )
         self.btn_open_capture_folder.pack(side=tk.LEFT, padx=5)
 
+        # Save the buffered last seconds of each feed
+        self.btn_history1 = ttk.Button(
+            self.capture_frame,
+            text=f"Save Last {self.rtp_source1.history.seconds:g}s Feed 1",
+            command=lambda: self.save_history(1)
+        )
+        self.btn_history1.pack(side=tk.LEFT, padx=5)
+
+        self.btn_history2 = ttk.Button(
+            self.capture_frame,
+            text=f"Save Last {self.rtp_source2.history.seconds:g}s Feed 2",
+            command=lambda: self.save_history(2)
+        )
+        self.btn_history2.pack(side=tk.LEFT, padx=5)
+
+        # Capture format and burst length
+        ttk.Label(self.capture_frame, text="Format:").pack(side=tk.LEFT, padx=(10, 0))
+        self.format_var = tk.StringVar(value="jpg")
+        self.format_combo = ttk.Combobox(self.capture_frame, textvariable=self.format_var,
+                                         values=FORMATS, width=4, state="readonly")
+        self.format_combo.pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(self.capture_frame, text="Burst:").pack(side=tk.LEFT)
+        self.burst_var = tk.IntVar(value=1)
+        max_burst = min(self.rtp_source1.max_burst, self.rtp_source2.max_burst)
+        self.burst_spin = ttk.Spinbox(self.capture_frame, from_=1, to=max_burst, textvariable=self.burst_var, width=3)
+        self.burst_spin.pack(side=tk.LEFT, padx=5)
+
         # Connection frame
         self.connection_frame = ttk.Frame(self.control_frame)
         self.connection_frame.pack(side=tk.TOP, fill=tk.X, pady=5)
@@ -234,8 +636,8 @@ class CameraCaptureApp:
         self.port_entry2 = ttk.Entry(self.port_frame2, textvariable=self.port_var2, width=6)
         self.port_entry2.pack(side=tk.LEFT, padx=5)
 
-        self.last_frame_hash1 = None
-        self.last_frame_hash2 = None
+        self.last_shown1 = None
+        self.last_shown2 = None
         
         self.btn_connect2 = ttk.Button(
             self.port_frame2,
@@ -253,7 +655,8 @@ class CameraCaptureApp:
         self.chk_process1 = ttk.Checkbutton(
             self.view_frame,
             text="Show Retinex on Feed 1",
-            variable=self.process_var1
+            variable=self.process_var1,
+            command=lambda: self.update_feed("Feed 1")
         )
         self.chk_process1.pack(side=tk.LEFT, padx=20)
         
@@ -261,9 +664,44 @@ class CameraCaptureApp:
         self.chk_process2 = ttk.Checkbutton(
             self.view_frame,
             text="Show Retinex on Feed 2",
-            variable=self.process_var2
+            variable=self.process_var2,
+            command=lambda: self.update_feed("Feed 2")
         )
         self.chk_process2.pack(side=tk.LEFT, padx=20)
+
+        # Denoise method per feed, a speed/quality tradeoff for the Retinex view and captures
+        ttk.Label(self.view_frame, text="Denoise 1:").pack(side=tk.LEFT)
+        self.denoise_var1 = tk.StringVar(value=default_method())
+        self.denoise_combo1 = ttk.Combobox(self.view_frame, textvariable=self.denoise_var1,
+                                           values=list(DENOISERS), width=14, state="readonly")
+        self.denoise_combo1.bind("<<ComboboxSelected>>", lambda e: self.rtp_source1.set_denoise(self.denoise_var1.get()))
+        self.denoise_combo1.pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(self.view_frame, text="Denoise 2:").pack(side=tk.LEFT)
+        self.denoise_var2 = tk.StringVar(value=default_method())
+        self.denoise_combo2 = ttk.Combobox(self.view_frame, textvariable=self.denoise_var2,
+                                           values=list(DENOISERS), width=14, state="readonly")
+        self.denoise_combo2.bind("<<ComboboxSelected>>", lambda e: self.rtp_source2.set_denoise(self.denoise_var2.get()))
+        self.denoise_combo2.pack(side=tk.LEFT, padx=5)
+
+        # Record checkboxes; recordings go next to the captured frames
+        self.record_var1 = tk.BooleanVar(value=False)
+        self.chk_record1 = ttk.Checkbutton(
+            self.view_frame,
+            text="Record Feed 1",
+            variable=self.record_var1,
+            command=lambda: self.toggle_recording(1)
+        )
+        self.chk_record1.pack(side=tk.LEFT, padx=20)
+
+        self.record_var2 = tk.BooleanVar(value=False)
+        self.chk_record2 = ttk.Checkbutton(
+            self.view_frame,
+            text="Record Feed 2",
+            variable=self.record_var2,
+            command=lambda: self.toggle_recording(2)
+        )
+        self.chk_record2.pack(side=tk.LEFT, padx=20)
         
         # Exit button
         self.btn_exit = ttk.Button(
@@ -273,6 +711,25 @@ class CameraCaptureApp:
         )
         self.btn_exit.pack(side=tk.RIGHT, padx=5)
 
+        # Stage timing overlay (F2), periodic dump and cProfile toggle (F3)
+        self.stage_names = {
+            feed: {stage: f"{feed} {stage}" for stage in ("get_frame", "draw", "status", "update", "display latency")}
+            for feed in ("Feed 1", "Feed 2")
+        }
+        self.timing_label = tk.Label(self.cameras_frame, font="TkFixedFont", justify=tk.LEFT,
+                                     anchor="nw", bg="black", fg="#7CFC00")
+        self.timing_overlay = False
+        self.timing_dump = os.environ.get("STAGE_TIMING_DUMP")
+        self.timing_interval = float(os.environ.get("STAGE_TIMING_INTERVAL", "10"))
+        # The appsink callbacks and Retinex workers run through the same profiler
+        self.profiler = profiler
+        self.profiler.directory = self.output_dir
+        self.root.bind("<F2>", lambda e: self.toggle_timing_overlay())
+        self.root.bind("<F3>", lambda e: self.profiler.toggle())
+        if self.timing_dump:
+            timer.enabled = True
+            self.root.after(int(self.timing_interval * 1000), self.dump_timing)
+
         # Start the RTP sources and update loop
         self.running = True
         self.connect_to_stream(1)  # Start Feed 1 with default port
@@ -290,10 +747,6 @@ class CameraCaptureApp:
             port_var = self.port_var2
             status_label = self.status_label2
             
-        # Stop current stream if running
-        if rtp_source.running:
-            rtp_source.stop()
-                
         # Get port from entry
         try:
             port = int(port_var.get())
@@ -307,148 +760,212 @@ class CameraCaptureApp:
         status_label.config(text=f"Connecting to RTP stream on port {port}...")
         self.root.update()
                 
-        # Create new RTP source with the specified port
-        new_source = GstreamerRTPSource(port=port)
+        # Carry over the record setting
+        record_var = self.record_var1 if feed_number == 1 else self.record_var2
+        rtp_source.record_dir = self.output_dir / "recordings" if record_var.get() else None
                 
-        # Start the RTP source
+        # Move the source's branch to the new port, or start it the first time
         try:
-            new_source.start()
+            rtp_source.reconnect(port)
+            rtp_source.start()
             status_label.config(text=f"Connected to RTP stream on port {port}")
             
-            # Update the reference to the source
+            # Redraw from the new stream's first frame
             if feed_number == 1:
-                self.rtp_source1 = new_source
+                self.last_shown1 = None
             else:
-                self.rtp_source2 = new_source
+                self.last_shown2 = None
                 
         except Exception as e:
             messagebox.showerror("Connection Error", f"Failed to connect to port {port}: {e}")
             status_label.config(text="Connection failed")
     
-    def process_frame(self, frame, apply_retinex=False):
-        """Process frame with optional Retinex enhancement"""
-        if frame is None:
-            return None
-            
-        if apply_retinex:
-            try:
-                frame = underwater_retinex_gpu(frame)
-            except Exception as e:
-                print(f"Error applying Retinex: {e}")
-                # If Retinex fails, return the original frame
-        return frame
-    
-    def capture_no_retinex_frames(self, feed_number):
-        """Capture 1 frame without Retinex processing from specified feed"""
+    def toggle_recording(self, feed_number):
+        """Start or stop recording the given feed from its checkbox"""
         if feed_number == 1:
             rtp_source = self.rtp_source1
-            status_label = self.status_label1
+            record_var = self.record_var1
         else:
             rtp_source = self.rtp_source2
-            status_label = self.status_label2
+            record_var = self.record_var2
 
-        frame = rtp_source.get_frame()
-        if frame is None:
+        if record_var.get():
+            try:
+                rtp_source.start_recording(self.output_dir / "recordings")
+            except Exception as e:
+                record_var.set(False)
+                messagebox.showerror("Recording Error", f"Failed to start recording Feed {feed_number}: {e}")
+        else:
+            rtp_source.stop_recording()
+
+    def capture_frames(self, feed_number, apply_retinex):
+        """Queue the latest frame (or a burst of recent frames) from a feed for saving"""
+        rtp_source = self.rtp_source1 if feed_number == 1 else self.rtp_source2
+
+        try:
+            burst = min(max(1, int(self.burst_var.get())), rtp_source.max_burst)
+        except (tk.TclError, ValueError):
+            burst = 1
+        frames = rtp_source.get_capture_frames(burst)
+        if not frames:
             messagebox.showerror("Error", f"No video stream available on Feed {feed_number}")
             return
 
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.output_dir, f"feed{feed_number}_no_retinex_{timestamp}.jpg")
-        cv2.imwrite(filename, frame)
-        self.root.update()
+        kind = "retinex" if apply_retinex else "no_retinex"
+        if not self.capture_writer.submit(frames, self.output_dir, f"feed{feed_number}_{kind}",
+                                          self.format_var.get(), apply_retinex, rtp_source.denoise):
+            print(f"Capture queue full ({self.capture_writer.pending} frames pending), "
+                  f"dropped capture on Feed {feed_number}")
+            self.root.bell()
+
+    def save_history(self, feed_number):
+        """Save the buffered last seconds of a feed next to the captured frames"""
+        rtp_source = self.rtp_source1 if feed_number == 1 else self.rtp_source2
+        _, _, count = rtp_source.history.usage() if rtp_source.history is not None else (0, 0.0, 0)
+        if count == 0:
+            messagebox.showerror("Error", f"No buffered video on Feed {feed_number}")
+            return
+        rtp_source.save_history(self.output_dir)
+
+    def capture_no_retinex_frames(self, feed_number):
+        """Capture without Retinex processing from specified feed"""
+        self.capture_frames(feed_number, apply_retinex=False)
 
     def capture_retinex_frames(self, feed_number):
-        """Capture 1 frame with Retinex processing from specified feed"""
-        if feed_number == 1:
-            rtp_source = self.rtp_source1
-            status_label = self.status_label1
+        """Capture with Retinex processing from specified feed"""
+        self.capture_frames(feed_number, apply_retinex=True)
+    
+    def toggle_timing_overlay(self):
+        """Show or hide the per-stage timing table over the feeds"""
+        self.timing_overlay = not self.timing_overlay
+        if self.timing_overlay:
+            timer.enabled = True
+            self.timing_label.place(x=0, y=0)
+            self.update_timing_overlay()
         else:
-            rtp_source = self.rtp_source2
-            status_label = self.status_label2
+            self.timing_label.place_forget()
+            timer.enabled = bool(self.timing_dump or os.environ.get("STAGE_TIMING"))
 
-        frame = rtp_source.get_frame()
-        if frame is None:
-            messagebox.showerror("Error", f"No video stream available on Feed {feed_number}")
+    def update_timing_overlay(self):
+        if not self.running or not self.timing_overlay:
             return
+        self.timing_label.config(text=timer.overlay_text())
+        self.root.after(500, self.update_timing_overlay)
+
+    def dump_timing(self):
+        """Write the stage timings to STAGE_TIMING_DUMP every STAGE_TIMING_INTERVAL seconds"""
+        if not self.running:
+            return
+        try:
+            timer.dump(self.timing_dump)
+        except OSError as e:
+            print(f"Failed to write stage timings to {self.timing_dump}: {e}")
+        self.root.after(int(self.timing_interval * 1000), self.dump_timing)
+
+    def on_frames_ready(self, pending):
+        """Redraw the feeds that reported new frames, once per wakeup however many arrived"""
+        if not self.running:
+            return
+        for feed_name, arrival in pending.items():
+            self.update_feed(feed_name, arrival)
 
-        processed_frame = self.process_frame(frame, apply_retinex=True)
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.output_dir, f"feed{feed_number}_retinex_{timestamp}.jpg")
-        cv2.imwrite(filename, processed_frame)
-        self.root.update()
-    
     def update_frames(self):
-        """Update both camera feed displays"""
+        """Slow poll of both feeds for stalled streams and status; new frames are drawn from on_frames_ready"""
         if self.running:
-            # Process Feed 1
+            self.update_feed("Feed 1")
+            self.update_feed("Feed 2")
+
+            # Schedule the next check
+            self.root.after(STALL_POLL_MS, self.update_frames)
+
+    def update_feed(self, feed_name, arrival=None):
+        """Update one feed by name"""
+        if feed_name == "Feed 1":
             self.update_single_frame(
-                self.rtp_source1, 
-                self.cam_label1, 
-                self.status_label1, 
+                self.rtp_source1,
+                self.cam_label1,
+                self.status_label1,
                 self.process_var1.get(),
-                "Feed 1"
+                "Feed 1",
+                arrival
             )
-            
-            # Process Feed 2
+        else:
             self.update_single_frame(
-                self.rtp_source2, 
-                self.cam_label2, 
-                self.status_label2, 
+                self.rtp_source2,
+                self.cam_label2,
+                self.status_label2,
                 self.process_var2.get(),
-                "Feed 2"
+                "Feed 2",
+                arrival
             )
-            
-            # Schedule the next update
-            self.root.after(30, self.update_frames)  # ~30 FPS
     
-    def update_single_frame(self, rtp_source, cam_label, status_label, apply_retinex, feed_name):
+    def update_single_frame(self, rtp_source, cam_label, status_label, apply_retinex, feed_name, arrival=None):
         """Update a single camera feed display"""
-        # Get the current frame from the RTP source
-        frame = rtp_source.get_frame()
+        stages = self.stage_names[feed_name]
+        started = timer.start()
+
+        # Get the current frame and its id from the RTP source
+        frame, frame_id = rtp_source.get_latest()
+
+        # Retinex runs on the source's worker thread; only blit its latest result here
+        processor = rtp_source.processor
+        processor.set_enabled(apply_retinex)
+        stats = ""
         
         if frame is not None:
-            # Apply Retinex if enabled in preview
+            shown = ("raw", frame_id)
             if apply_retinex:
-                frame = self.process_frame(frame, apply_retinex=True)
+                result, result_id = processor.get_result()
+                if result is not None:
+                    frame = result
+                    shown = ("retinex", result_id)
+                stats = f" | {processor.stats_text()}"
 
+            # Skip the update before doing any work if nothing new arrived
+            if feed_name == "Feed 1":
+                if self.last_shown1 == shown:
+                    return
+                self.last_shown1 = shown
+            else:
+                if self.last_shown2 == shown:
+                    return
+                self.last_shown2 = shown
+            timer.stop(stages["get_frame"], started)
 
-                frame_hash = hash(frame.tobytes())
-                if feed_name == "Feed 1":
-                    if self.last_frame_hash1 == frame_hash:
-                        return # skip update if frame is the same
-                    self.last_frame_hash1 = frame_hash
-                else:
-                    if self.last_frame_hash2 == frame_hash:
-                        return
-                    self.last_frame_hash2 = frame_hash
+            # Frames are already RGB straight from the pipeline; the display scales them to fit
+            step = timer.start()
+            self.displays[feed_name].show(frame)
+            timer.stop(stages["draw"], step)
 
-            
-            # Convert to RGB for display
-            display_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Resize if needed (smaller for dual display)
-            if display_frame.shape[1] > 522 or display_frame.shape[0] > 928:
-                display_frame = cv2.resize(display_frame, (522, 928))
-            
-            # Convert to PhotoImage and update display
-            img = ImageTk.PhotoImage(image=Image.fromarray(display_frame))
-            cam_label.config(image=img)
-            cam_label.image = img  # Keep a reference to prevent garbage collection
+            # Time from the frame being ready to it being drawn, smoothed for the label
+            if arrival is not None:
+                latency = time.monotonic() - arrival
+                if timer.enabled:
+                    timer.record(stages["display latency"], latency)
+                previous = self.display_latency[feed_name]
+                self.display_latency[feed_name] = 0.9 * previous + 0.1 * latency if previous else latency
             
             # Update status to show dimensions
+            step = timer.start()
             h, w = frame.shape[:2]
-            status_label.config(text=f"{feed_name}: {w}x{h}")
+            display = f" | display +{self.display_latency[feed_name] * 1000:.1f} ms"
+            status_label.config(text=f"{feed_name}: {w}x{h}{display}{stats}\n{rtp_source.stats_text()}")
+            timer.stop(stages["status"], step)
+            timer.stop(stages["update"], started)
         else:
             # No frame available - only update if not already shown as empty
             attribute_name = f'_no_frame_shown_{feed_name}'
             if not getattr(self, attribute_name, False):
                 setattr(self, attribute_name, True)
-                cam_label.config(image='')
+                self.displays[feed_name].clear()
                 status_label.config(text=f"Waiting for {feed_name} stream...")
 
     def close_app(self):
         """Clean up resources and close the application"""
         self.running = False
+
+        # No more frame wakeups; the sources' threads must not wait on Tk while they stop
+        self.notifier.close()
         
         # Stop both RTP sources
         if hasattr(self, 'rtp_source1'):
@@ -456,6 +973,12 @@ class CameraCaptureApp:
             
         if hasattr(self, 'rtp_source2'):
             self.rtp_source2.stop()
+
+        # Then the shared pipeline and main loop
+        self.stream_manager.stop()
+
+        # Finish writing queued captures
+        self.capture_writer.close()
             
         self.root.destroy()
 
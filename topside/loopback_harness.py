@@ -0,0 +1,101 @@
+import sys
+import time
+from argparse import ArgumentParser
+
+from gi.repository import Gst
+
+from interface import GstreamerRTPSource
+from stream_manager import StreamManager
+
+def make_sender(port, width, height, loss, reorder, bitrate):
+    """videotestsrc -> x264enc -> RTP -> netsim (simulated loss/reordering) -> udpsink on loopback"""
+    pipeline_str = (
+        f'videotestsrc is-live=true pattern=ball ! '
+        f'video/x-raw,width={width},height={height},framerate=30/1 ! '
+        f'x264enc tune=zerolatency speed-preset=ultrafast bitrate={bitrate} key-int-max=30 intra-refresh=true ! '
+        'rtph264pay config-interval=1 pt=96 ! '
+        f'netsim drop-probability={loss} delay-probability={reorder} min-delay=5 max-delay=40 ! '
+        f'udpsink host=127.0.0.1 port={port}'
+    )
+    return Gst.parse_launch(pipeline_str)
+
+def main():
+    parser = ArgumentParser(description="Drive GstreamerRTPSource from a local sender with simulated loss")
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--bitrate', type=int, default=2000)
+    parser.add_argument('--loss', type=float, default=0.02, help="Packet drop probability")
+    parser.add_argument('--reorder', type=float, default=0.02, help="Probability of delaying (reordering) a packet")
+    parser.add_argument('--jitter-latency', type=int, default=50,
+                        help="rtpjitterbuffer latency in ms, negative to receive without one")
+    parser.add_argument('--feeds', type=int, default=1,
+                        help="Number of feeds on consecutive ports, all in one shared pipeline")
+    parser.add_argument('--reconnects', type=int, default=0,
+                        help="Reconnect every feed this many times at the end and time it")
+    args = parser.parse_args()
+
+    jitter_latency = args.jitter_latency if args.jitter_latency >= 0 else None
+    ports = [args.port + i for i in range(args.feeds)]
+    manager = StreamManager()
+    manager.start()
+    sources = [GstreamerRTPSource(port=port, jitter_latency=jitter_latency, manager=manager) for port in ports]
+    for source in sources:
+        source.start()
+
+    senders = [make_sender(port, args.width, args.height, args.loss, args.reorder, args.bitrate) for port in ports]
+    for sender in senders:
+        sender.set_state(Gst.State.PLAYING)
+
+    reconnect_ms = []
+    first_frame_ms = []
+    try:
+        end = time.monotonic() + args.duration
+        while time.monotonic() < end:
+            time.sleep(1.0)
+            for source in sources:
+                print(f"port {source.port}: {source.stats_text()}")
+
+        # Rebind each feed to its own port and wait for the first frame from the new branch
+        for _ in range(args.reconnects):
+            for source in sources:
+                count = source.frame_count
+                started = time.perf_counter()
+                source.reconnect(source.port)
+                reconnect_ms.append((time.perf_counter() - started) * 1000)
+                while source.frame_count == count and time.perf_counter() - started < 5.0:
+                    time.sleep(0.002)
+                if source.frame_count != count:
+                    first_frame_ms.append((time.perf_counter() - started) * 1000)
+    finally:
+        for sender in senders:
+            sender.set_state(Gst.State.NULL)
+        for source in sources:
+            source.stop()
+        manager.stop()
+
+    failed = False
+    for source in sources:
+        stats = source.get_stats()
+        print(f"port {source.port}:")
+        for key, value in stats.items():
+            print(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+        if stats["frames_decoded"] == 0:
+            print(f"FAIL: no frames decoded on port {source.port}")
+            failed = True
+
+    if reconnect_ms:
+        reconnect_ms.sort()
+        print(f"reconnect: median {reconnect_ms[len(reconnect_ms) // 2]:.1f} ms, max {reconnect_ms[-1]:.1f} ms")
+    if first_frame_ms:
+        first_frame_ms.sort()
+        print(f"first frame after reconnect: median {first_frame_ms[len(first_frame_ms) // 2]:.1f} ms, "
+              f"max {first_frame_ms[-1]:.1f} ms")
+    if len(first_frame_ms) < len(reconnect_ms):
+        print(f"FAIL: {len(reconnect_ms) - len(first_frame_ms)} reconnect(s) got no frame within 5 s")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
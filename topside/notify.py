@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+import tkinter as tk
+
+# How often the Tk thread checks for new frames where it cannot watch a pipe
+FALLBACK_POLL_MS = 5
+
+class FrameNotifier:
+    """Wakes the Tk main loop from any thread when a feed has a new frame, coalescing bursts"""
+    def __init__(self, root, callback):
+        self.root = root
+        # Runs on the Tk thread with {key: arrival time of the first unhandled frame}
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.closed = False
+        self.read_fd = self.write_fd = None
+
+        # Never call into Tk from the streaming threads: that waits on the Tk thread and
+        # deadlocks while it waits for them to stop. Tk watches a pipe, or polls on Windows.
+        if os.name == "posix" and hasattr(root.tk, "createfilehandler"):
+            self.read_fd, self.write_fd = os.pipe()
+            os.set_blocking(self.read_fd, False)
+            os.set_blocking(self.write_fd, False)
+            root.tk.createfilehandler(self.read_fd, tk.READABLE, self._on_readable)
+        else:
+            self.root.after(FALLBACK_POLL_MS, self._poll)
+
+    def notify(self, key):
+        """Mark key as having a new frame and wake the Tk loop if it is not already woken"""
+        with self.lock:
+            if self.closed or key in self.pending:
+                return
+            wake = not self.pending
+            self.pending[key] = time.monotonic()
+            # Under the lock so close() cannot free the descriptor in between
+            if wake and self.write_fd is not None:
+                try:
+                    os.write(self.write_fd, b"x")
+                except (BlockingIOError, OSError):
+                    pass
+
+    def _on_readable(self, fd, mask):
+        try:
+            while os.read(fd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        self._dispatch()
+
+    def _poll(self):
+        if self.closed:
+            return
+        self._dispatch()
+        self.root.after(FALLBACK_POLL_MS, self._poll)
+
+    def _dispatch(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if pending and not self.closed:
+            self.callback(pending)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        if self.read_fd is not None:
+            self.root.tk.deletefilehandler(self.read_fd)
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+            self.read_fd = self.write_fd = None
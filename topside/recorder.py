@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+from pathlib import Path
+
+from gi.repository import Gst, GLib
+
+MUXERS = {
+    "matroska": ("matroskamux", "mkv"),
+    "mp4": ("mp4mux", "mp4"),
+}
+
+class StreamRecorder:
+    """Records the still-encoded H.264 from a tee into segmented files, with a .idx seek index per segment"""
+    def __init__(self, pipeline, tee, directory, prefix, muxer="matroska", segment_time=300, segment_bytes=0):
+        if muxer not in MUXERS:
+            raise ValueError(f"Unknown muxer '{muxer}', expected one of: {', '.join(MUXERS)}")
+        self.pipeline = pipeline
+        self.tee = tee
+        self.directory = Path(directory)
+        self.prefix = prefix
+        # Matroska by default: an mp4 is unreadable if the topside dies mid-segment
+        self.muxer = muxer
+        # Segments are cut at keyframes past either limit (0 = no limit)
+        self.segment_time = segment_time
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.finished.set()
+        self.bin = None
+        self.tee_pad = None
+        self.stopping = False
+        self.files = []
+        self.bytes_written = 0
+        self.index_file = None
+        self.position = 0
+        self.last_pts = None
+        self.started = None
+
+    @property
+    def recording(self):
+        return self.bin is not None and not self.stopping
+
+    def _make_element(self, factory, name=None):
+        element = Gst.ElementFactory.make(factory, name)
+        if element is None:
+            raise RuntimeError(f"GStreamer element '{factory}' is not available")
+        return element
+
+    def start(self):
+        """Attach the recording branch to the tee"""
+        if self.bin is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        muxer_factory, _ = MUXERS[self.muxer]
+
+        # queue ! h264parse ! splitmuxsink, with our own filesink so its output can be indexed
+        queue = self._make_element("queue")
+        queue.set_property("max-size-buffers", 0)
+        queue.set_property("max-size-bytes", 0)
+        queue.set_property("max-size-time", 2 * Gst.SECOND)
+        Gst.util_set_object_arg(queue, "leaky", "downstream")
+        parse = self._make_element("h264parse")
+        filesink = self._make_element("filesink")
+        splitmux = self._make_element("splitmuxsink")
+        splitmux.set_property("muxer", self._make_element(muxer_factory))
+        splitmux.set_property("sink", filesink)
+        splitmux.set_property("max-size-time", int(self.segment_time * Gst.SECOND) if self.segment_time else 0)
+        splitmux.set_property("max-size-bytes", self.segment_bytes)
+        splitmux.connect("format-location", self.on_format_location)
+
+        self.bin = Gst.Bin.new(f"record_{self.prefix}")
+        for element in (queue, parse, splitmux):
+            self.bin.add(element)
+        queue.link(parse)
+        parse.link(splitmux)
+        self.bin.add_pad(Gst.GhostPad.new("sink", queue.get_static_pad("sink")))
+
+        # Drop delta frames until the first keyframe so every file starts decodable
+        queue.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self.wait_for_keyframe)
+        filesink.get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self.on_muxed_data)
+
+        self.stopping = False
+        self.finished.clear()
+        self.started = time.monotonic()
+        self.pipeline.add(self.bin)
+        self.bin.sync_state_with_parent()
+        self.tee_pad = self.tee.get_request_pad("src_%u")
+        self.tee_pad.link(self.bin.get_static_pad("sink"))
+
+    def stop(self):
+        """Detach from the tee and finish the current segment in the background"""
+        if self.bin is None or self.stopping:
+            return
+        self.stopping = True
+        self.tee_pad.add_probe(Gst.PadProbeType.IDLE, self.on_tee_idle)
+
+    def wait(self, timeout=None):
+        """Wait until the last segment is closed; returns False on timeout"""
+        return self.finished.wait(timeout)
+
+    def wait_for_keyframe(self, pad, info):
+        if info.get_buffer().has_flags(Gst.BufferFlags.DELTA_UNIT):
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.REMOVE
+
+    def on_tee_idle(self, pad, info):
+        """Unlink the branch while no buffer is passing, then push EOS through it to close the file"""
+        sink_pad = self.bin.get_static_pad("sink")
+        pad.unlink(sink_pad)
+        self.tee.release_request_pad(pad)
+        sink_pad.send_event(Gst.Event.new_eos())
+        return Gst.PadProbeReturn.REMOVE
+
+    def on_format_location(self, splitmux, fragment_id):
+        """Name the next segment and start its index"""
+        _, extension = MUXERS[self.muxer]
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        path = self.directory / f"{self.prefix}_{timestamp}_{fragment_id:04d}.{extension}"
+        with self.lock:
+            self._close_index()
+            self.index_file = open(path.with_name(path.name + ".idx"), "w")
+            self.index_file.write("pts_ns,offset,keyframe\n")
+            self.files.append(path)
+            self.position = 0
+            self.last_pts = None
+        return str(path)
+
+    def on_muxed_data(self, pad, info):
+        """Track the byte position of muxed frames as the filesink writes them"""
+        if info.type & Gst.PadProbeType.BUFFER:
+            buf = info.get_buffer()
+            with self.lock:
+                if buf.pts != Gst.CLOCK_TIME_NONE and buf.pts != self.last_pts and self.index_file is not None:
+                    keyframe = 0 if buf.has_flags(Gst.BufferFlags.DELTA_UNIT) else 1
+                    self.index_file.write(f"{buf.pts},{self.position},{keyframe}\n")
+                    self.last_pts = buf.pts
+                self.position += buf.get_size()
+                self.bytes_written += buf.get_size()
+            return Gst.PadProbeReturn.OK
+
+        event = info.get_event()
+        if event.type == Gst.EventType.SEGMENT:
+            # The muxer seeks back to rewrite its headers with a byte segment
+            segment = event.parse_segment()
+            if segment.format == Gst.Format.BYTES:
+                with self.lock:
+                    self.position = segment.start
+        elif event.type == Gst.EventType.EOS and self.stopping:
+            GLib.idle_add(self._finish)
+        return Gst.PadProbeReturn.OK
+
+    def _close_index(self):
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+    def _finish(self):
+        """Remove the drained branch from the pipeline (runs on the GLib loop)"""
+        if self.bin is not None:
+            self.bin.set_state(Gst.State.NULL)
+            self.pipeline.remove(self.bin)
+            self.bin = None
+        with self.lock:
+            self._close_index()
+        self.stopping = False
+        self.finished.set()
+        return False
+
+    def abort(self):
+        """Drop the branch without waiting, e.g. when the pipeline is already shutting down"""
+        if self.bin is not None:
+            self._finish()
+
+    def summary(self):
+        """Short recording summary for the status labels"""
+        if not self.recording:
+            return ""
+        elapsed = time.monotonic() - self.started
+        return f"REC {int(elapsed) // 60}:{int(elapsed) % 60:02d}, {self.bytes_written / 1e6:.1f} MB"
+
+def load_index(path):
+    """Read a segment's .idx file into a list of (pts_ns, offset, keyframe)"""
+    entries = []
+    with open(path) as f:
+        next(f)
+        for line in f:
+            pts, offset, keyframe = line.strip().split(",")
+            entries.append((int(pts), int(offset), keyframe == "1"))
+    return entries
+
+def seek_offset(entries, pts):
+    """Byte offset of the last keyframe at or before pts, for seeking into a segment"""
+    keyframes = [entry for entry in entries if entry[2]]
+    i = bisect.bisect_right([entry[0] for entry in keyframes], pts) - 1
+    return keyframes[max(i, 0)][1] if keyframes else 0
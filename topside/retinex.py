@@ -1,31 +1,59 @@
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
-# Checks if CUDA is available
+from denoise import bilateral, get_denoiser
+
+# Environment variable that overrides backend selection ("cpu", "opencl", "cuda" or "auto")
+BACKEND_ENV_VAR = "RETINEX_BACKEND"
+
+# Environment variable that sets the thread count of the tiled Retinex (default: one per core)
+THREADS_ENV_VAR = "RETINEX_THREADS"
+
+# Checks if CUDA is available (probed once)
+@functools.lru_cache(maxsize=None)
 def is_cuda_available():
-    return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
 
-def white_balance(img):
-    """GPU-accelerated white balance correction with CUDA or OpenCL"""
-    if img is None or len(img.shape) != 3:
-        raise ValueError("Input image must be a valid 3-channel color image.")
-    
-    if is_cuda_available():
-        img_gpu = cv2.cuda_GpuMat()
-        img_gpu.upload(img)
-        bgr = cv2.cuda.split(img_gpu)
-        avg_b = cv2.cuda.mean(bgr[0])[0]
-        avg_g = cv2.cuda.mean(bgr[1])[0]
-        avg_r = cv2.cuda.mean(bgr[2])[0]
+# Checks if OpenCL has a real GPU behind it (probed once)
+@functools.lru_cache(maxsize=None)
+def is_opencl_available():
+    if not cv2.ocl.haveOpenCL():
+        return False
+    device = cv2.ocl.Device.getDefault()
+    return bool(device.available() and device.type() & cv2.ocl.Device_TYPE_GPU)
+
+class CpuBackend:
+    """Plain NumPy arrays, no device uploads"""
+    name = "cpu"
+
+    def white_balance(self, img):
+        avg_b, avg_g, avg_r = cv2.mean(img)[:3]
         scale = (avg_g + avg_r + avg_b) / (3 * np.array([avg_b, avg_g, avg_r]))
-        b = cv2.cuda.multiply(bgr[0], scale[0])
-        g = cv2.cuda.multiply(bgr[1], scale[1])
-        r = cv2.cuda.multiply(bgr[2], scale[2])
-        merged = cv2.cuda.merge((b, g, r))
-        return merged.download()
-    
-    else:
+        return cv2.multiply(img, (float(scale[0]), float(scale[1]), float(scale[2]), 0.0))
 
+    def single_scale_retinex(self, img_float, sigma):
+        blurred = cv2.GaussianBlur(img_float, (0, 0), sigma)
+        log_img = cv2.log(img_float + 1.0)
+        log_blur = cv2.log(blurred + 1.0)
+        return log_img - log_blur
+
+    def normalize(self, retinex, denoise=None):
+        retinex_norm = cv2.normalize(retinex, None, 0, 255, cv2.NORM_MINMAX)
+        retinex_norm = cv2.convertScaleAbs(retinex_norm)
+        return get_denoiser(denoise)(retinex_norm)
+
+class OpenCLBackend:
+    """cv2.UMat transparent API, runs on the OpenCL device"""
+    name = "opencl"
+
+    def white_balance(self, img):
         # Convert to UMat for GPU processing
         img_umat = cv2.UMat(img)
         b, g, r = cv2.split(img_umat)
@@ -46,20 +74,7 @@ def white_balance(img):
         # Merge back and get result from GPU
         return cv2.merge((b, g, r)).get()
 
-    
-
-def single_scale_retinex_gpu(img, sigma):
-    """GPU-accelerated Single-Scale Retinex with CUDA or OpenCL"""
-    img_float = img.astype(np.float32)
-    if is_cuda_available():
-        img_gpu = cv2.cuda_GpuMat()
-        img_gpu.upload(img_float)
-        blurred = cv2.cuda.createGaussianFilter(img_gpu.type(), img_gpu.type(), (0, 0), sigma).apply(img_gpu)
-        log_img = cv2.cuda.log(cv2.cuda.add(img_gpu, 1.0))
-        log_blur = cv2.cuda.log(cv2.cuda.add(blurred, 1.0))
-        retinex = cv2.cuda.subtract(log_img, log_blur)
-        return retinex.download()
-    else:
+    def single_scale_retinex(self, img_float, sigma):
         img_umat = cv2.UMat(img_float)
     
         # Gaussian blur on GPU
@@ -73,40 +88,525 @@ def single_scale_retinex_gpu(img, sigma):
         retinex = cv2.subtract(log_img, log_blur)
         return retinex.get()
 
-def multi_scale_retinex_gpu(img, sigmas=[15, 80, 250]):
+    def normalize(self, retinex, denoise=None):
+        # Normalization and bilateral filter on GPU
+        retinex_umat = cv2.UMat(retinex)
+        retinex_norm = cv2.normalize(retinex_umat, None, 0, 255, cv2.NORM_MINMAX)
+        retinex_norm = cv2.convertScaleAbs(retinex_norm)
+        denoiser = get_denoiser(denoise)
+        if denoiser is bilateral:
+            return bilateral(retinex_norm).get()
+
+        # The other methods run on the downloaded frame
+        return denoiser(retinex_norm.get())
+
+class CudaBackend:
+    """cv2.cuda with device buffers and Gaussian filters cached across frames"""
+    name = "cuda"
+
+    def __init__(self):
+        self.buffers = {}
+        self.filters = {}
+
+    def _upload(self, key, img):
+        """Upload into a GpuMat reused per key, shape and dtype"""
+        key = (key, img.shape, img.dtype.str)
+        img_gpu = self.buffers.get(key)
+        if img_gpu is None:
+            img_gpu = self.buffers[key] = cv2.cuda_GpuMat()
+        img_gpu.upload(img)
+        return img_gpu
+
+    def _gaussian_filter(self, mat_type, sigma):
+        key = (mat_type, sigma)
+        gaussian = self.filters.get(key)
+        if gaussian is None:
+            gaussian = self.filters[key] = cv2.cuda.createGaussianFilter(mat_type, mat_type, (0, 0), sigma)
+        return gaussian
+
+    def white_balance(self, img):
+        img_gpu = self._upload("wb", img)
+        bgr = cv2.cuda.split(img_gpu)
+        avg_b = cv2.cuda.mean(bgr[0])[0]
+        avg_g = cv2.cuda.mean(bgr[1])[0]
+        avg_r = cv2.cuda.mean(bgr[2])[0]
+        scale = (avg_g + avg_r + avg_b) / (3 * np.array([avg_b, avg_g, avg_r]))
+        b = cv2.cuda.multiply(bgr[0], scale[0])
+        g = cv2.cuda.multiply(bgr[1], scale[1])
+        r = cv2.cuda.multiply(bgr[2], scale[2])
+        merged = cv2.cuda.merge((b, g, r))
+        return merged.download()
+
+    def single_scale_retinex(self, img_float, sigma):
+        img_gpu = self._upload("ssr", img_float)
+        blurred = self._gaussian_filter(img_gpu.type(), sigma).apply(img_gpu)
+        log_img = cv2.cuda.log(cv2.cuda.add(img_gpu, 1.0))
+        log_blur = cv2.cuda.log(cv2.cuda.add(blurred, 1.0))
+        retinex = cv2.cuda.subtract(log_img, log_blur)
+        return retinex.download()
+
+    def normalize(self, retinex, denoise=None):
+        retinex_gpu = self._upload("norm", retinex)
+        retinex_norm = cv2.cuda.normalize(retinex_gpu, None, 0, 255, cv2.NORM_MINMAX)
+        retinex_norm = cv2.cuda.convertTo(retinex_norm, cv2.CV_8U)
+
+        retinex_norm_cpu = retinex_norm.download()
+        return get_denoiser(denoise)(retinex_norm_cpu)
+
+_backend_instances = {}
+
+def get_backend(name=None):
+    """Get the Retinex backend by name, the RETINEX_BACKEND env var, or auto-detection"""
+    if name is None:
+        name = os.environ.get(BACKEND_ENV_VAR, "auto")
+    name = name.lower()
+
+    if name == "auto":
+        if is_cuda_available():
+            name = "cuda"
+        elif is_opencl_available():
+            name = "opencl"
+        else:
+            name = "cpu"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown Retinex backend {name!r}, expected one of {', '.join(BACKENDS)} or auto")
+
+    backend = _backend_instances.get(name)
+    if backend is None:
+        backend = _backend_instances[name] = BACKENDS[name]()
+    return backend
+
+def white_balance(img, backend=None):
+    """GPU-accelerated white balance correction with CUDA or OpenCL"""
+    if img is None or len(img.shape) != 3:
+        raise ValueError("Input image must be a valid 3-channel color image.")
+    return get_backend(backend).white_balance(img)
+
+def single_scale_retinex_gpu(img, sigma, backend=None):
+    """GPU-accelerated Single-Scale Retinex with CUDA or OpenCL"""
+    img_float = img.astype(np.float32)
+    return get_backend(backend).single_scale_retinex(img_float, sigma)
+
+def multi_scale_retinex_gpu(img, sigmas=[15, 80, 250], backend=None):
     """GPU-accelerated Multi-Scale Retinex"""
     retinex = np.zeros_like(img, dtype=np.float32)
     
     for sigma in sigmas:
-        retinex += single_scale_retinex_gpu(img, sigma)
+        retinex += single_scale_retinex_gpu(img, sigma, backend=backend)
     
     return retinex / len(sigmas)
 
-def underwater_retinex_gpu(img):
-    """Optimized underwater Retinex with GPU acceleration"""
+class FastMultiScaleRetinex:
+    """Multi-Scale Retinex with one log per frame, large sigmas on a pyramid and reused buffers"""
+    def __init__(self, sigmas=(15, 80, 250), min_sigma=8.0):
+        self.sigmas = tuple(sigmas)
+        # Sigmas blur on the smallest pyramid level that keeps them above min_sigma
+        self.min_sigma = min_sigma
+        self.shape = None
+
+    def _scale_factor(self, sigma):
+        """Largest power-of-two downscale that keeps the blur above min_sigma"""
+        factor = 1
+        while sigma / (factor * 2) >= self.min_sigma:
+            factor *= 2
+        return factor
+
+    def _allocate(self, shape):
+        """(Re)allocate the float32 work buffers for a frame shape"""
+        h, w = shape[:2]
+        self.shape = shape
+        self.img = np.empty(shape, dtype=np.float32)
+        self.log_img = np.empty(shape, dtype=np.float32)
+        self.blur = np.empty(shape, dtype=np.float32)
+        self.log_sum = np.empty(shape, dtype=np.float32)
+
+        # Downsampled buffers, one pair per distinct factor
+        self.small = {}
+        for sigma in self.sigmas:
+            factor = self._scale_factor(sigma)
+            if factor > 1 and factor not in self.small:
+                size = (max(1, round(w / factor)), max(1, round(h / factor)))
+                small_shape = (size[1], size[0]) + tuple(shape[2:])
+                self.small[factor] = (
+                    size,
+                    np.empty(small_shape, dtype=np.float32),
+                    np.empty(small_shape, dtype=np.float32),
+                )
+
+    def _prepare(self):
+        """Compute log(img + 1) of the loaded image once for all scales"""
+        np.add(self.img, 1.0, out=self.blur)
+        cv2.log(self.blur, self.log_img)
+
+    def _gaussian(self, src, sigma, dst):
+        """Gaussian blur of src into dst"""
+        cv2.GaussianBlur(src, (0, 0), sigma, dst=dst)
+
+    def _add_log_blurs(self, sigmas, out):
+        """Add log(blur + 1) of the loaded image into out for each sigma"""
+        h, w = self.shape[:2]
+        downsampled = set()
+        for sigma in sigmas:
+            factor = self._scale_factor(sigma)
+            if factor == 1:
+                self._gaussian(self.img, sigma, self.blur)
+            else:
+                # Blur on the pyramid level and upsample the illumination estimate
+                size, small, small_blur = self.small[factor]
+                if factor not in downsampled:
+                    cv2.resize(self.img, size, dst=small, interpolation=cv2.INTER_AREA)
+                    downsampled.add(factor)
+                self._gaussian(small, sigma / factor, small_blur)
+                cv2.resize(small_blur, (w, h), dst=self.blur, interpolation=cv2.INTER_LINEAR)
+
+            self.blur += 1.0
+            cv2.log(self.blur, self.blur)
+            out += self.blur
+
+    def __call__(self, img):
+        """MSR of img; the returned buffer is reused, so it is only valid until the next call"""
+        if img.shape != self.shape:
+            self._allocate(img.shape)
+
+        self.img[...] = img
+        self._prepare()
+
+        self.log_sum.fill(0.0)
+        self._add_log_blurs(self.sigmas, self.log_sum)
+
+        # Average of (log_img - log_blur) over scales
+        self.log_sum *= 1.0 / len(self.sigmas)
+        np.subtract(self.log_img, self.log_sum, out=self.log_sum)
+        return self.log_sum
+
+def box_sizes(sigma, passes=3):
+    """Odd box widths whose repeated application approximates a Gaussian of sigma"""
+    ideal = np.sqrt(12.0 * sigma * sigma / passes + 1.0)
+    lower = int(ideal)
+    if lower % 2 == 0:
+        lower -= 1
+    lower = max(lower, 1)
+    upper = lower + 2
+    # Number of passes that use the lower width so the total variance matches sigma^2
+    m = round((12.0 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if i < m else upper for i in range(passes)]
+
+class BoxMultiScaleRetinex(FastMultiScaleRetinex):
+    """FastMultiScaleRetinex with Gaussians approximated by three box filters
+
+    A box filter costs the same for any width, so every scale costs about
+    the same regardless of sigma. For uint8 input, load_uint8() fills the
+    white-balanced image and its log through lookup tables instead of
+    per-pixel multiplies and logs.
+    """
+    def __init__(self, sigmas=(15, 80, 250), min_sigma=8.0):
+        super().__init__(sigmas, min_sigma)
+        self.scratch = {}
+        self.wb_lut = np.empty((1, 256, 3), dtype=np.float32)
+        self.log_lut = np.empty((1, 256, 3), dtype=np.float32)
+
+    def _gaussian(self, src, sigma, dst):
+        scratch = self.scratch.get(src.shape)
+        if scratch is None:
+            scratch = self.scratch[src.shape] = np.empty(src.shape, dtype=np.float32)
+
+        # Ping-pong src -> dst -> scratch -> dst
+        first, second, third = box_sizes(sigma)
+        cv2.boxFilter(src, -1, (first, first), dst=dst, borderType=cv2.BORDER_REFLECT)
+        cv2.boxFilter(dst, -1, (second, second), dst=scratch, borderType=cv2.BORDER_REFLECT)
+        cv2.boxFilter(scratch, -1, (third, third), dst=dst, borderType=cv2.BORDER_REFLECT)
+
+    def load_uint8(self, img, scale):
+        """Load a uint8 image white-balanced by per-channel scale, with its log, through LUTs"""
+        if img.shape != self.shape:
+            self._allocate(img.shape)
+
+        # Same rounding and saturation as cv2.multiply on uint8
+        values = np.clip(np.rint(np.arange(256, dtype=np.float32)[:, None] * np.asarray(scale, np.float32)), 0, 255)
+        self.wb_lut[0] = values
+        np.log(values + 1.0, out=self.log_lut[0])
+        cv2.LUT(img, self.wb_lut, dst=self.img)
+        cv2.LUT(img, self.log_lut, dst=self.log_img)
+
+    def from_loaded(self):
+        """MSR of the image loaded with load_uint8()"""
+        self.log_sum.fill(0.0)
+        self._add_log_blurs(self.sigmas, self.log_sum)
+        self.log_sum *= 1.0 / len(self.sigmas)
+        np.subtract(self.log_img, self.log_sum, out=self.log_sum)
+        return self.log_sum
+
+def default_workers():
+    """Tiled Retinex thread count from the RETINEX_THREADS env var, or one per core"""
+    return max(1, int(os.environ.get(THREADS_ENV_VAR, 0)) or os.cpu_count() or 1)
+
+def gaussian_radius(sigma):
+    """Kernel radius OpenCV picks for a float32 GaussianBlur with ksize (0, 0)"""
+    return (int(round(sigma * 8 + 1)) | 1) // 2
+
+class TiledMultiScaleRetinex(FastMultiScaleRetinex):
+    """FastMultiScaleRetinex with full-resolution blurs in haloed row bands and pyramid levels on a thread pool"""
+    def __init__(self, sigmas=(15, 80, 250), min_sigma=8.0, workers=None):
+        super().__init__(sigmas, min_sigma)
+        # OpenCV and NumPy release the GIL, so the tasks run in parallel; one worker runs inline
+        self.workers = workers or default_workers()
+        self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="retinex-tile") if self.workers > 1 else None
+
+    def _allocate(self, shape):
+        super()._allocate(shape)
+        self.blurs = {sigma: np.empty(shape, dtype=np.float32) for sigma in self.sigmas}
+        h = shape[0]
+        rows = -(-h // self.workers)
+        self.bands = [(y, min(h, y + rows)) for y in range(0, h, rows)]
+
+    def _run(self, tasks):
+        """Run the callables on the pool and wait for all of them, re-raising the first error"""
+        if self.pool is None:
+            for task in tasks:
+                task()
+            return
+        for future in [self.pool.submit(task) for task in tasks]:
+            future.result()
+
+    def _prepare(self):
+        def band(y0, y1):
+            np.add(self.img[y0:y1], 1.0, out=self.blur[y0:y1])
+            cv2.log(self.blur[y0:y1], self.log_img[y0:y1])
+        self._run([functools.partial(band, y0, y1) for y0, y1 in self.bands])
+
+    def _blur_band(self, sigma, y0, y1):
+        """Full-resolution blur of rows y0:y1, reading a halo of the kernel radius around them"""
+        h = self.shape[0]
+        halo = gaussian_radius(sigma)
+        top, bottom = max(0, y0 - halo), min(h, y1 + halo)
+        if top == y0 and bottom == y1:
+            cv2.GaussianBlur(self.img[y0:y1], (0, 0), sigma, dst=self.blurs[sigma][y0:y1])
+        else:
+            blurred = cv2.GaussianBlur(self.img[top:bottom], (0, 0), sigma)
+            self.blurs[sigma][y0:y1] = blurred[y0 - top:y1 - top]
+
+    def _blur_level(self, factor, sigmas):
+        """Downsample once, then blur and upsample each sigma that uses this pyramid level"""
+        h, w = self.shape[:2]
+        size, small, small_blur = self.small[factor]
+        cv2.resize(self.img, size, dst=small, interpolation=cv2.INTER_AREA)
+        for sigma in sigmas:
+            self._gaussian(small, sigma / factor, small_blur)
+            cv2.resize(small_blur, (w, h), dst=self.blurs[sigma], interpolation=cv2.INTER_LINEAR)
+
+    def _add_log_blurs(self, sigmas, out):
+        tasks = []
+        levels = {}
+        for sigma in sigmas:
+            factor = self._scale_factor(sigma)
+            if factor == 1:
+                tasks += [functools.partial(self._blur_band, sigma, y0, y1) for y0, y1 in self.bands]
+            else:
+                levels.setdefault(factor, []).append(sigma)
+        tasks += [functools.partial(self._blur_level, factor, level) for factor, level in levels.items()]
+        self._run(tasks)
+
+        # Same per-pixel order as the untiled engine, band by band
+        def band(y0, y1):
+            for sigma in sigmas:
+                blur = self.blurs[sigma][y0:y1]
+                blur += 1.0
+                cv2.log(blur, blur)
+                out[y0:y1] += blur
+        self._run([functools.partial(band, y0, y1) for y0, y1 in self.bands])
+
+    def close(self):
+        """Shut down the worker threads"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+class NumpyBackend:
+    """Vectorized CPU path with lookup tables, box-filter Gaussians and reused buffers
+
+    underwater_retinex_gpu() hands the whole pipeline to underwater_retinex(),
+    which never builds float64 arrays or per-frame accumulators and returns
+    uint8 straight from the normalization.
+    """
+    name = "numpy"
+
+    def __init__(self):
+        self.engine = BoxMultiScaleRetinex()
+
+    def _wb_scale(self, img):
+        avg = np.maximum(np.array(cv2.mean(img)[:3], dtype=np.float32), 1e-6)
+        return avg.mean() / avg
+
+    def white_balance(self, img):
+        scale = self._wb_scale(img)
+        lut = np.clip(np.rint(np.arange(256, dtype=np.float32)[:, None] * scale), 0, 255).astype(np.uint8)
+        return cv2.LUT(img, lut.reshape(1, 256, 3))
+
+    def single_scale_retinex(self, img_float, sigma):
+        blurred = np.empty_like(img_float)
+        self.engine._gaussian(img_float, sigma, blurred)
+        blurred += 1.0
+        cv2.log(blurred, blurred)
+        log_img = cv2.log(img_float + 1.0)
+        log_img -= blurred
+        return log_img
+
+    def normalize(self, retinex, denoise=None):
+        retinex_norm = cv2.normalize(retinex, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        return get_denoiser(denoise)(retinex_norm)
+
+    def underwater_retinex(self, img, sigmas=(15, 80, 250), denoise=None):
+        if img.dtype != np.uint8:
+            img = np.clip(img, 0, 255).astype(np.uint8)
+        if self.engine.sigmas != tuple(sigmas):
+            self.engine = BoxMultiScaleRetinex(sigmas)
+        self.engine.load_uint8(img, self._wb_scale(img))
+        return self.normalize(self.engine.from_loaded(), denoise)
+
+class TiledBackend(CpuBackend):
+    """CPU path with the MSR tiled over RETINEX_THREADS threads (see TiledMultiScaleRetinex)
+
+    underwater_retinex() matches underwater_retinex_gpu() with a
+    FastMultiScaleRetinex on the cpu backend, just spread over the cores.
+    """
+    name = "tiled"
+
+    def __init__(self):
+        self.engine = TiledMultiScaleRetinex()
+
+    def underwater_retinex(self, img, sigmas=(15, 80, 250), denoise=None):
+        if self.engine.sigmas != tuple(sigmas):
+            self.engine.close()
+            self.engine = TiledMultiScaleRetinex(sigmas)
+        img_float = self.white_balance(img).astype(np.float32)
+        return self.normalize(self.engine(img_float), denoise)
+
+# The numpy and tiled backends build on the MSR engines, so the registry comes after all of them
+BACKENDS = {
+    "cpu": CpuBackend,
+    "opencl": OpenCLBackend,
+    "cuda": CudaBackend,
+    "numpy": NumpyBackend,
+    "tiled": TiledBackend,
+}
+
+def underwater_retinex_gpu(img, msr=None, backend=None, denoise=None):
+    """Optimized underwater Retinex with GPU acceleration
+
+    denoise picks the trailing edge-preserving filter (see denoise.py);
+    None uses the RETINEX_DENOISE env var or the original bilateral.
+    """
+    backend = get_backend(backend)
+
+    # The NumPy backend runs the whole pipeline in one fused pass
+    if msr is None and hasattr(backend, "underwater_retinex"):
+        return backend.underwater_retinex(img, denoise=denoise)
+
     # White balance on GPU
-    img_wb = white_balance(img)
+    img_wb = white_balance(img, backend=backend.name)
     
     # Convert to float32 for processing
     img_float = img_wb.astype(np.float32)
     
-    # MSR on GPU
-    retinex = multi_scale_retinex_gpu(img_float)
+    # MSR on GPU (or a FastMultiScaleRetinex engine)
+    if msr is None:
+        retinex = multi_scale_retinex_gpu(img_float, backend=backend.name)
+    else:
+        retinex = msr(img_float)
 
-    if is_cuda_available():
-        retinex_gpu = cv2.cuda_GpuMat()
-        retinex_gpu.upload(retinex)
-        retinex_norm = cv2.cuda.normalize(retinex_gpu, None, 0, 255, cv2.NORM_MINMAX)
-        retinex_norm = cv2.cuda.convertTo(retinex_norm, cv2.CV_8U)
+    # Normalization and edge-preserving denoise
+    return backend.normalize(retinex, denoise)
 
-        retinex_norm_cpu = retinex_norm.download()
-        retinex_filtered = cv2.bilateralFilter(retinex_norm_cpu, 9, 75, 75)
-        return retinex_filtered
-    else:
-    
-        # Normalization and bilateral filter on GPU
-        retinex_umat = cv2.UMat(retinex)
-        retinex_norm = cv2.normalize(retinex_umat, None, 0, 255, cv2.NORM_MINMAX)
-        retinex_norm = cv2.convertScaleAbs(retinex_norm)
-        retinex_filtered = cv2.bilateralFilter(retinex_norm, 9, 75, 75)
-        return retinex_filtered.get()
+class StreamingRetinex:
+    """Underwater Retinex for live video, refreshing white balance, illumination and bounds every few frames"""
+    def __init__(self, sigmas=(15, 80, 250), refresh_interval=10, change_threshold=0.08,
+                 alpha=0.3, cache_min_sigma=50, denoise=None):
+        self.denoise = denoise
+        # The full-resolution sigma-15 blur runs every frame, so it uses box filters, not a 121-tap Gaussian
+        self.engine = BoxMultiScaleRetinex(sigmas)
+        self.frame_sigmas = tuple(s for s in sigmas if s < cache_min_sigma)
+        self.cached_sigmas = tuple(s for s in sigmas if s >= cache_min_sigma)
+        self.refresh_interval = refresh_interval
+        self.change_threshold = change_threshold
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        """Forget the cached estimates so the next frame refreshes everything"""
+        self.frames_since_refresh = 0
+        self.thumb = None
+        self.wb_scale = None
+        self.log_illum = None
+        self.illum_new = None
+        self.bounds = None
+        self.refreshes = 0
+
+    def _thumbnail(self, img):
+        """Tiny grayscale copy used to detect scene changes"""
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gray, (32, 24), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _blend(self, old, new, hard):
+        """Exponential moving average of a cached estimate"""
+        if hard or old is None:
+            return new
+        return (1.0 - self.alpha) * old + self.alpha * new
+
+    def __call__(self, img):
+        if img is None or len(img.shape) != 3:
+            raise ValueError("Input image must be a valid 3-channel color image.")
+
+        engine = self.engine
+        if img.shape != engine.shape:
+            engine._allocate(img.shape)
+            self.reset()
+
+        # Refresh on a schedule, or immediately (without blending) on a scene change
+        thumb = self._thumbnail(img)
+        hard = self.thumb is None or np.abs(thumb - self.thumb).mean() / 255.0 > self.change_threshold
+        refresh = hard or self.frames_since_refresh >= self.refresh_interval
+
+        if refresh:
+            self.thumb = thumb
+            self.frames_since_refresh = 0
+            self.refreshes += 1
+
+            # Gray-world white balance scales from the channel averages
+            avg = np.maximum(np.array(cv2.mean(img)[:3], dtype=np.float32), 1e-6)
+            self.wb_scale = self._blend(self.wb_scale, avg.mean() / avg, hard)
+        self.frames_since_refresh += 1
+
+        # White-balanced image and its log straight into the engine's buffers, through LUTs
+        engine.load_uint8(img, self.wb_scale)
+
+        # Illumination estimate from the large sigmas, cached between refreshes
+        if refresh:
+            if self.illum_new is None:
+                self.illum_new = np.empty(img.shape, dtype=np.float32)
+                self.log_illum = np.empty(img.shape, dtype=np.float32)
+            self.illum_new.fill(0.0)
+            engine._add_log_blurs(self.cached_sigmas, self.illum_new)
+            if hard:
+                self.log_illum[...] = self.illum_new
+            else:
+                self.log_illum *= 1.0 - self.alpha
+                self.log_illum += self.alpha * self.illum_new
+
+        # Small sigmas every frame, then average with the cached illumination
+        retinex = engine.log_sum
+        np.copyto(retinex, self.log_illum)
+        engine._add_log_blurs(self.frame_sigmas, retinex)
+        retinex *= 1.0 / len(engine.sigmas)
+        np.subtract(engine.log_img, retinex, out=retinex)
+
+        # Normalize with cached bounds instead of a fresh min/max every frame
+        if refresh:
+            bounds = np.array([retinex.min(), retinex.max()], dtype=np.float32)
+            self.bounds = self._blend(self.bounds, bounds, hard)
+        lo, hi = self.bounds
+        retinex -= lo
+        retinex *= 255.0 / max(float(hi - lo), 1e-6)
+        np.clip(retinex, 0, 255, out=retinex)
+        retinex_norm = retinex.astype(np.uint8)
+
+        return get_denoiser(self.denoise)(retinex_norm)
@@ -0,0 +1,129 @@
+import threading
+import time
+
+# H.264 RTP payloads use a 90 kHz clock
+RTP_CLOCK_RATE = 90000
+
+class ReceiveStats:
+    """Live packet, delay and decode counters for an RTP receive pipeline, fed from udpsrc and the appsink"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all counters"""
+        with self.lock:
+            self.packets_received = 0
+            self.packets_reordered = 0
+            self.packets_duplicate = 0
+            self.base_seq = None
+            self.highest_seq = None
+            self.seen = set()
+
+            # Network delay is transit relative to the fastest packet, so it leaves out the ROV's fixed encode time
+            self.min_transit = None
+            self.last_transit = None
+            self.network_delay = 0.0
+            self.jitter = 0.0
+
+            self.frames_decoded = 0
+            self.decode_fps = 0.0
+            self.last_frame_time = None
+            self.pipeline_latency = 0.0
+
+            self.jitterbuffer_lost = None
+            self.jitterbuffer_late = None
+
+    def on_packet(self, seq, rtp_ts, arrival=None):
+        """Account for one RTP packet (16-bit seq, 32-bit timestamp)"""
+        if arrival is None:
+            arrival = time.monotonic()
+
+        with self.lock:
+            self.packets_received += 1
+
+            # Extend the 16-bit sequence number relative to the highest seen so far
+            if self.highest_seq is None:
+                ext_seq = seq
+                self.base_seq = seq
+                self.highest_seq = seq
+            else:
+                delta = (seq - self.highest_seq) & 0xFFFF
+                if delta >= 0x8000:
+                    delta -= 0x10000
+                ext_seq = self.highest_seq + delta
+                if delta > 0:
+                    self.highest_seq = ext_seq
+
+            if ext_seq in self.seen:
+                self.packets_duplicate += 1
+            elif ext_seq < self.highest_seq:
+                self.packets_reordered += 1
+            self.seen.add(ext_seq)
+            if len(self.seen) > 4096:
+                self.seen = {s for s in self.seen if s > self.highest_seq - 1024}
+
+            # Transit time against the RTP clock; the offset cancels out in differences
+            transit = arrival - rtp_ts / RTP_CLOCK_RATE
+            if self.last_transit is not None:
+                # RFC 3550 interarrival jitter
+                d = abs(transit - self.last_transit)
+                if d < 1.0:
+                    self.jitter += (d - self.jitter) / 16.0
+            self.last_transit = transit
+            if self.min_transit is None or transit < self.min_transit or transit - self.min_transit > 10.0:
+                self.min_transit = transit
+            self.network_delay = 0.9 * self.network_delay + 0.1 * (transit - self.min_transit)
+
+    def on_frame(self, pipeline_latency=None, now=None):
+        """Account for one decoded frame, with its receive-to-sink latency in seconds"""
+        if now is None:
+            now = time.monotonic()
+
+        with self.lock:
+            self.frames_decoded += 1
+            if self.last_frame_time is not None:
+                fps = 1.0 / max(now - self.last_frame_time, 1e-6)
+                self.decode_fps = 0.9 * self.decode_fps + 0.1 * fps if self.decode_fps else fps
+            self.last_frame_time = now
+            if pipeline_latency is not None and pipeline_latency >= 0:
+                if self.pipeline_latency:
+                    self.pipeline_latency = 0.9 * self.pipeline_latency + 0.1 * pipeline_latency
+                else:
+                    self.pipeline_latency = pipeline_latency
+
+    def update_jitterbuffer(self, stats):
+        """Merge in the "stats" structure from rtpjitterbuffer"""
+        with self.lock:
+            self.jitterbuffer_lost = stats.get_value("num-lost")
+            self.jitterbuffer_late = stats.get_value("num-late")
+
+    def snapshot(self):
+        """Get the current counters as a dict"""
+        with self.lock:
+            expected = 0 if self.highest_seq is None else self.highest_seq - self.base_seq + 1
+            lost = max(expected - self.packets_received + self.packets_duplicate, 0)
+            if self.jitterbuffer_lost is not None:
+                lost = self.jitterbuffer_lost
+            return {
+                "packets_received": self.packets_received,
+                "packets_expected": expected,
+                "packets_lost": lost,
+                "packets_late": self.jitterbuffer_late or 0,
+                "packets_reordered": self.packets_reordered,
+                "packets_duplicate": self.packets_duplicate,
+                "loss_percent": 100.0 * lost / expected if expected else 0.0,
+                "jitter_ms": self.jitter * 1000,
+                "network_delay_ms": self.network_delay * 1000,
+                "pipeline_latency_ms": self.pipeline_latency * 1000,
+                "glass_latency_ms": (self.network_delay + self.pipeline_latency) * 1000,
+                "frames_decoded": self.frames_decoded,
+                "decode_fps": self.decode_fps,
+            }
+
+    def summary(self):
+        """Short receive summary for the status labels"""
+        stats = self.snapshot()
+        return (f"{stats['decode_fps']:.1f} FPS, loss {stats['loss_percent']:.1f}%, "
+                f"late {stats['packets_late']}, reord {stats['packets_reordered']}, "
+                f"~{stats['glass_latency_ms']:.0f} ms")
@@ -0,0 +1,180 @@
+import importlib.util
+import random
+import socket
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from feedback import FeedbackSender
+from rtp_stats import ReceiveStats
+
+# The ROV side of the feedback loop lives in rov/feedback.py, which shares this module's name
+ROV_FEEDBACK = Path(__file__).parent.parent / "rov" / "feedback.py"
+
+def load_rov_feedback():
+    """Load rov/feedback.py, or None when only the topside folder was copied over"""
+    if not ROV_FEEDBACK.exists():
+        return None
+    spec = importlib.util.spec_from_file_location("rov_feedback", ROV_FEEDBACK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+PACKET_SIZE = 1200
+
+class LossyLink:
+    """UDP relay on loopback that drops packets above a bandwidth cap, plus random loss"""
+    def __init__(self, listen_port, forward_port, capacity_kbps, loss, queue_ms=100):
+        self.forward = ("127.0.0.1", forward_port)
+        self.rate = capacity_kbps * 1000 / 8
+        self.bucket_size = self.rate * queue_ms / 1000
+        self.tokens = self.bucket_size
+        self.loss = loss
+        self.last = time.monotonic()
+        self.dropped = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", listen_port))
+        self.sock.settimeout(0.5)
+        self.out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                data = self.sock.recv(2048)
+            except socket.timeout:
+                continue
+            now = time.monotonic()
+            self.tokens = min(self.bucket_size, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < len(data) or random.random() < self.loss:
+                self.dropped += 1
+                continue
+            self.tokens -= len(data)
+            self.out.sendto(data, self.forward)
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+        self.sock.close()
+        self.out.close()
+
+class SyntheticSender:
+    """Stands in for x264enc + rtph264pay: sends RTP-sized packets at the controller's bitrate"""
+    def __init__(self, port, controller, fps=30):
+        self.dest = ("127.0.0.1", port)
+        self.controller = controller
+        self.fps = fps
+        self.bitrate = controller.bitrate
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        seq = 0
+        frame = 0
+        start = time.monotonic()
+        while self.running:
+            change = self.controller.poll()
+            if change is not None:
+                self.bitrate = change[0]
+
+            # One frame's worth of packets, all with the frame's RTP timestamp
+            rtp_ts = (frame * 90000 // self.fps) & 0xFFFFFFFF
+            frame_bytes = int(self.bitrate * 1000 / 8 / self.fps)
+            for _ in range(max(1, frame_bytes // PACKET_SIZE)):
+                header = bytes([0x80, 96]) + (seq & 0xFFFF).to_bytes(2, "big") + rtp_ts.to_bytes(4, "big")
+                self.sock.sendto(header + bytes(PACKET_SIZE - len(header)), self.dest)
+                seq += 1
+            frame += 1
+            time.sleep(max(0.0, start + frame / self.fps - time.monotonic()))
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+        self.sock.close()
+
+def main():
+    parser = ArgumentParser(description="Exercise the adaptive bitrate loop over a simulated loopback link")
+    parser.add_argument('--port', type=int, default=5700, help="Receive port; the relay uses port+1")
+    parser.add_argument('--capacity', type=int, default=2000, help="Link capacity in kbps")
+    parser.add_argument('--loss', type=float, default=0.0, help="Extra random packet loss probability")
+    parser.add_argument('--bitrate', type=int, default=4000, help="Starting (maximum) bitrate in kbps")
+    parser.add_argument('--duration', type=float, default=30.0)
+    args = parser.parse_args()
+
+    rov_feedback = load_rov_feedback()
+    if rov_feedback is None:
+        print(f"This simulation needs the ROV code from the full repository ({ROV_FEEDBACK} not found)")
+        return 1
+
+    stats = ReceiveStats()
+    controller = rov_feedback.AdaptiveController(args.bitrate)
+    receiver = rov_feedback.FeedbackReceiver(args.port + rov_feedback.FEEDBACK_PORT_OFFSET, controller.on_report)
+    feedback = FeedbackSender(args.port, "127.0.0.1")
+
+    # Topside receive socket feeding the same stats the GUI uses
+    recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv_sock.bind(("127.0.0.1", args.port))
+    recv_sock.settimeout(0.5)
+    running = True
+
+    def receive():
+        while running:
+            try:
+                data = recv_sock.recv(2048)
+            except socket.timeout:
+                continue
+            stats.on_packet(int.from_bytes(data[2:4], "big"), int.from_bytes(data[4:8], "big"))
+
+    recv_thread = threading.Thread(target=receive, daemon=True)
+    recv_thread.start()
+    link = LossyLink(args.port + 1, args.port, args.capacity, args.loss)
+    sender = SyntheticSender(args.port + 1, controller)
+
+    losses = []
+    failed_sends = 0
+    try:
+        end = time.monotonic() + args.duration
+        while time.monotonic() < end:
+            time.sleep(1.0)
+            report = feedback.send(stats.snapshot())
+            # send() has already printed why; the controller just misses this interval
+            if report is None:
+                failed_sends += 1
+                continue
+            losses.append(report["loss"])
+            print(f"bitrate {sender.bitrate:5d} kbps, scale {controller.scale:g}, {controller.fps} fps, "
+                  f"loss {report['loss']:5.1f}%, delay {report['delay_ms']:5.1f} ms")
+    finally:
+        running = False
+        sender.close()
+        link.close()
+        receiver.close()
+        feedback.close()
+        recv_thread.join(timeout=1.0)
+        recv_sock.close()
+
+    if failed_sends:
+        print(f"{failed_sends} feedback report(s) could not be sent")
+    if not losses:
+        print("FAIL: no feedback report was sent")
+        return 1
+
+    recent = losses[-5:]
+    mean_loss = sum(recent) / max(len(recent), 1)
+    print(f"Final bitrate {sender.bitrate} kbps on a {args.capacity} kbps link, "
+          f"recent loss {mean_loss:.1f}%")
+    if sender.bitrate > args.capacity * 1.25 or mean_loss > 10.0 + 100 * args.loss:
+        print("FAIL: bitrate did not settle under the link capacity")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
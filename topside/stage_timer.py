@@ -0,0 +1,186 @@
+import cProfile
+import csv
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+
+# Bucket edges (ms) for the histograms in dumps
+HISTOGRAM_EDGES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+class StageTimer:
+    """Rolling per-stage timings for the hot paths: t = timer.start() ... timer.stop("stage", t)"""
+    def __init__(self, enabled=False, window=512):
+        # Disabled, start() returns None and stop() returns at once, so the calls stay in per-frame code
+        self.enabled = enabled
+        # Last window durations per stage, for percentiles and histograms
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counts = {}
+
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name, started):
+        if started is None:
+            return
+        self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        """Add one duration for a stage"""
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+                self.counts[name] = 0
+            samples.append(seconds)
+            self.counts[name] += 1
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+
+    def snapshot(self):
+        """{stage: count, mean/p50/p90/p99/max in ms, and histogram bucket counts} over the window"""
+        with self.lock:
+            windows = {name: sorted(samples) for name, samples in self.samples.items()}
+            counts = dict(self.counts)
+
+        result = {}
+        for name, samples in sorted(windows.items()):
+            if not samples:
+                continue
+            ms = [s * 1000 for s in samples]
+            pick = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))]
+            histogram = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+            edge = 0
+            for value in ms:
+                while edge < len(HISTOGRAM_EDGES_MS) and value > HISTOGRAM_EDGES_MS[edge]:
+                    edge += 1
+                histogram[edge] += 1
+            result[name] = {
+                "count": counts[name],
+                "mean_ms": sum(ms) / len(ms),
+                "p50_ms": pick(0.5),
+                "p90_ms": pick(0.9),
+                "p99_ms": pick(0.99),
+                "max_ms": ms[-1],
+                "histogram": histogram,
+            }
+        return result
+
+    def overlay_text(self):
+        """Fixed-width table for the on-screen overlay"""
+        lines = [f"{'stage':<24}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}"]
+        for name, stats in self.snapshot().items():
+            lines.append(f"{name:<24}{stats['p50_ms']:8.2f}{stats['p90_ms']:8.2f}"
+                         f"{stats['p99_ms']:8.2f}{stats['max_ms']:8.2f}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write the current snapshot; .csv appends one row per stage, anything else rewrites JSON"""
+        snapshot = self.snapshot()
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        if str(path).endswith(".csv"):
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["time", "stage", "count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"])
+                for name, stats in snapshot.items():
+                    writer.writerow([now, name, stats["count"]] +
+                                    [f"{stats[key]:.3f}" for key in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")])
+        else:
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"time": now, "histogram_edges_ms": HISTOGRAM_EDGES_MS, "stages": snapshot}, f, indent=2)
+            os.replace(tmp, path)
+
+# One timer per process, shared by every instrumented module
+timer = StageTimer(enabled=bool(os.environ.get("STAGE_TIMING")))
+
+class ProfileToggle:
+    """cProfile of the toggling thread and of every call run through profiled(), switched on and off (e.g. from a hotkey)"""
+    def __init__(self, directory=".", prefix="profile"):
+        self.directory = directory
+        self.prefix = prefix
+        self.profile = None
+        self.owner = None
+        self.cond = threading.Condition()
+        self.thread_profiles = {}
+        self.running_calls = 0
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def profiled(self, fn, *args):
+        """Call fn(*args), under a profile of the calling thread while profiling is on"""
+        ident = threading.get_ident()
+        if self.profile is None or PROFILES_ALL_THREADS or ident == self.owner:
+            return fn(*args)
+
+        # GStreamer's streaming threads get a new Python thread state for each callback,
+        # so worker profiles are switched on around each call rather than once per thread
+        with self.cond:
+            if self.profile is None:
+                profile = None
+            else:
+                profile = self.thread_profiles.get(ident)
+                if profile is None:
+                    profile = self.thread_profiles[ident] = cProfile.Profile()
+                self.running_calls += 1
+        if profile is None:
+            return fn(*args)
+        try:
+            return profile.runcall(fn, *args)
+        finally:
+            with self.cond:
+                self.running_calls -= 1
+                self.cond.notify_all()
+
+    def wrap(self, fn):
+        """fn run through profiled(), e.g. for a GStreamer signal handler"""
+        return functools.partial(self.profiled, fn)
+
+    def toggle(self):
+        """Start or stop profiling; returns the saved path when stopping"""
+        if self.profile is None:
+            with self.cond:
+                self.thread_profiles = {}
+                self.owner = threading.get_ident()
+                self.profile = cProfile.Profile()
+            self.profile.enable()
+            print(f"Profiling started (pid {os.getpid()})")
+            return None
+
+        self.profile.disable()
+        with self.cond:
+            profile, self.profile = self.profile, None
+            # Let calls still running on other threads finish into their profiles
+            self.cond.wait_for(lambda: self.running_calls == 0, timeout=1.0)
+            thread_profiles, self.thread_profiles = self.thread_profiles, {}
+
+        path = os.path.join(self.directory, f"{self.prefix}_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        for thread_profile in thread_profiles.values():
+            stats.add(thread_profile)
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(15)
+        print(out.getvalue())
+        print(f"Profile saved to {path} ({len(thread_profiles) + 1} threads)")
+        return path
+
+# cProfile runs on sys.monitoring from 3.12 and then sees every thread by itself
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+# One profiler per process, so worker threads can run their hot paths through it
+profiler = ProfileToggle()
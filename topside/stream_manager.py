@@ -0,0 +1,106 @@
+import threading
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+Gst.init(None)
+
+class StreamManager:
+    """One GLib main loop and one live pipeline shared by every feed, each feed added and removed as its own bin"""
+    def __init__(self, name="feeds"):
+        self.name = name
+        self.lock = threading.Lock()
+        self.pipeline = None
+        # GLib timers and idle callbacks (feedback reports, recorder cleanup) run on this one loop
+        self.loop = None
+        self.loop_thread = None
+        # Feed bins by name, udpsrc through their appsinks
+        self.branches = {}
+
+    @property
+    def running(self):
+        return self.pipeline is not None
+
+    def start(self):
+        """Start the (empty) pipeline and the main loop thread"""
+        with self.lock:
+            if self.pipeline is not None:
+                return
+            self.pipeline = Gst.Pipeline.new(self.name)
+            bus = self.pipeline.get_bus()
+            bus.add_signal_watch()
+            bus.connect("message", self.on_message)
+            self.pipeline.set_state(Gst.State.PLAYING)
+
+            self.loop = GLib.MainLoop()
+            self.loop_thread = threading.Thread(target=self.loop.run, name=f"{self.name}-glib")
+            self.loop_thread.daemon = True
+            self.loop_thread.start()
+
+    def add(self, branch):
+        """Add a feed's bin to the running pipeline and bring it up to PLAYING
+
+        Raises RuntimeError (with the bin removed again) if it cannot start,
+        e.g. when its UDP port is already taken.
+        """
+        self.start()
+        name = branch.get_name()
+        with self.lock:
+            if name in self.branches:
+                raise ValueError(f"A branch named {name!r} is already in the pipeline")
+            self.branches[name] = branch
+        self.pipeline.add(branch)
+        if not branch.sync_state_with_parent():
+            self.remove(branch)
+            raise RuntimeError(f"Failed to start {name}")
+        # The new live source changes the pipeline latency the sinks sync against
+        self.pipeline.recalculate_latency()
+
+    def remove(self, branch):
+        """Stop a feed's bin and take it out of the pipeline; the other feeds keep running"""
+        with self.lock:
+            if self.branches.get(branch.get_name()) is not branch:
+                return
+            del self.branches[branch.get_name()]
+        branch.set_state(Gst.State.NULL)
+        self.pipeline.remove(branch)
+
+    def branch_of(self, element):
+        """The feed bin an element belongs to, or None"""
+        while element is not None:
+            parent = element.get_parent()
+            if parent == self.pipeline:
+                return element
+            element = parent
+        return None
+
+    def on_message(self, bus, message):
+        """Report errors and warnings with the feed they came from"""
+        if message.type not in (Gst.MessageType.ERROR, Gst.MessageType.WARNING):
+            return
+        branch = self.branch_of(message.src)
+        where = branch.get_name() if branch is not None else self.name
+        if message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            print(f"GStreamer error on {where}: {err.message}")
+        else:
+            err, debug = message.parse_warning()
+            print(f"GStreamer warning on {where}: {err.message}")
+
+    def stop(self):
+        """Stop every feed, the pipeline and the main loop"""
+        with self.lock:
+            if self.pipeline is None:
+                return
+            pipeline, self.pipeline = self.pipeline, None
+            self.branches.clear()
+
+        pipeline.set_state(Gst.State.NULL)
+        pipeline.get_bus().remove_signal_watch()
+
+        if self.loop and self.loop.is_running():
+            self.loop.quit()
+        if self.loop_thread and self.loop_thread.is_alive():
+            self.loop_thread.join(timeout=1.0)